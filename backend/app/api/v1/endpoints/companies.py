@@ -1,13 +1,31 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 
-from app.api.v1.schemas.invitations import Invitation, InvitationCreate, InvitationStatus
-from app.api.v1.schemas.users import User, RoleType, DispatcherAssociationStatus, DriverAssociationStatus
+from app.api.v1.schemas.invitations import Invitation, InvitationCreate, InvitationStatus, InvitationBatchCreate, InvitationBatchResult
+from app.api.v1.schemas.users import User, RoleType, DispatcherAssociationStatus, DriverAssociationStatus, FieldProfile
+from app.api.v1.schemas.analytics import JobAnalytics
+from app.api.v1.schemas.roster import CompanyRoster
 from app.crud import invitation, user
+from app.crud.jobs import job
+from app.db.mongodb import ASSOCIATION_STATUS_FIELDS, InvitationResponseError
+from app.core.fast_json import fast_response
 from app.api.v1.endpoints.users import get_current_user # Keep this for now, will refactor users.py later
 
 router = APIRouter()
 
+# Upper bound on invitee_usernames accepted by a single bulk invitation request
+MAX_INVITATION_BATCH_SIZE = 500
+
+INVITATION_ERROR_STATUS = {
+    "not_found": status.HTTP_404_NOT_FOUND,
+    "forbidden": status.HTTP_403_FORBIDDEN,
+    "not_pending": status.HTTP_400_BAD_REQUEST,
+}
+
+def invitation_http_error(error: InvitationResponseError) -> HTTPException:
+    # Used by the driver and dispatcher accept/decline endpoints
+    return HTTPException(status_code=INVITATION_ERROR_STATUS[error.reason], detail=error.detail)
+
 # Dependency to check if the current user is a company
 async def get_current_company(current_user: User = Depends(get_current_user)) -> User:
     if RoleType.COMPANY.value not in current_user.roles:
@@ -38,28 +56,93 @@ async def send_invitation(
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to send invitation: {e}")
 
+@router.post("/invitations/batch", response_model=InvitationBatchResult)
+async def send_invitations(
+    batch_in: InvitationBatchCreate,
+    current_company: User = Depends(get_current_company)
+):
+    """
+    Invites many users in one request: one $in lookup for every username, the role and
+    association checks in memory, one insert_many and one update_many.
+    Each username gets its own outcome; one bad username does not fail the batch.
+    """
+    if batch_in.invitee_role.value not in ASSOCIATION_STATUS_FIELDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only dispatchers and drivers can be invited.")
+    if len(batch_in.invitee_usernames) > MAX_INVITATION_BATCH_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_INVITATION_BATCH_SIZE} users can be invited per request.")
+
+    usernames = list(dict.fromkeys(batch_in.invitee_usernames)) # De-duplicate, keeping request order
+    users_by_username = await user.get_many_by_username(usernames)
+    role = batch_in.invitee_role.value
+    status_field, status_enum = ASSOCIATION_STATUS_FIELDS[role]
+    results = {}
+    invitees = []
+    for username in usernames:
+        invitee_user = users_by_username.get(username)
+        if not invitee_user:
+            results[username] = {"invitee_username": username, "outcome": "not_found", "detail": "Invitee user not found."}
+        elif role not in invitee_user["roles"]:
+            results[username] = {"invitee_username": username, "outcome": "wrong_role", "detail": f"Invitee is not a {role}."}
+        elif invitee_user.get(status_field) == status_enum.ASSOCIATED.value:
+            results[username] = {"invitee_username": username, "outcome": "already_associated", "detail": f"{role.capitalize()} is already associated with a company."}
+        else:
+            invitees.append(invitee_user)
+
+    new_invitations = await invitation.create_many(
+        invitees,
+        invitee_role=batch_in.invitee_role,
+        company_id=current_company.id,
+        company_name=current_company.name or current_company.username
+    )
+    for new_invitation in new_invitations:
+        results[new_invitation["invitee_username"]] = {"invitee_username": new_invitation["invitee_username"], "outcome": "ok", "invitation": new_invitation}
+    return {"results": [results[username] for username in usernames]}
+
+@router.get("/roster", response_model=CompanyRoster)
+async def get_company_roster(
+    current_company: User = Depends(get_current_company)
+):
+    # Dispatchers, drivers with their vehicles, pending invitations and counts in one aggregation
+    return await user.get_company_roster(current_company.id)
+
 @router.get("/users/company_dispatchers", response_model=List[User])
 async def get_company_dispatchers(
+    fast: bool = False, # Opt-in: serialize trusted documents without per-item validation
+    profile: FieldProfile = FieldProfile.FULL, # Lists that only show names send "identity"
     current_company: User = Depends(get_current_company)
 ):
     company_id_to_filter = current_company.id
-    dispatchers = await user.get_dispatchers_by_company_id(company_id_to_filter)
+    dispatchers = await user.get_dispatchers_by_company_id(company_id_to_filter, profile.value)
+    if fast:
+        return fast_response(dispatchers, User)
     return [User(**d) for d in dispatchers]
 
 @router.get("/users/company_drivers", response_model=List[User])
 async def get_company_drivers(
+    fast: bool = False, # Opt-in: serialize trusted documents without per-item validation
+    profile: FieldProfile = FieldProfile.FULL, # Lists that only show names send "identity"
     current_company: User = Depends(get_current_company)
 ):
     company_id_to_filter = current_company.id
-    drivers = await user.get_drivers_by_company_id(company_id_to_filter)
+    drivers = await user.get_drivers_by_company_id(company_id_to_filter, profile.value)
+    if fast:
+        return fast_response(drivers, User)
     return [User(**d) for d in drivers]
 
+@router.get("/analytics", response_model=JobAnalytics)
+async def get_company_analytics(
+    include_archived: bool = False, # Also count jobs moved to the monthly archive collections
+    current_company: User = Depends(get_current_company)
+):
+    # Served from a short-lived cache that job writes invalidate
+    return await job.get_company_analytics(current_company.id, include_archived)
+
 @router.put("/users/{dispatcher_id}/remove_company", response_model=User)
 async def remove_dispatcher_from_company(
     dispatcher_id: str,
     current_company: User = Depends(get_current_company)
 ):
-    target_dispatcher = await user.get_by_id(dispatcher_id)
+    target_dispatcher = await user.get_by_id(dispatcher_id, profile=FieldProfile.PICKER.value) # Roles, company and association statuses
     if not target_dispatcher or RoleType.DISPATCHER.value not in target_dispatcher.get("roles", []):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dispatcher not found.")
 
@@ -84,7 +167,7 @@ async def remove_driver_from_company(
     driver_id: str,
     current_company: User = Depends(get_current_company)
 ):
-    target_driver = await user.get_by_id(driver_id)
+    target_driver = await user.get_by_id(driver_id, profile=FieldProfile.PICKER.value) # Roles, company and association statuses
     if not target_driver or RoleType.DRIVER.value not in target_driver.get("roles", []):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Driver not found.")
 
@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Header
 from fastapi.responses import StreamingResponse
-from openpyxl import Workbook, load_workbook
-from io import BytesIO
 from typing import List, Optional
 
 from app.api.v1.schemas.jobs import Job, JobCreate, JobStatus
-from app.api.v1.schemas.users import User, RoleType, DispatcherAssociationStatus
-from app.api.v1.schemas.invitations import Invitation, InvitationCreate, InvitationStatus
-from app.crud import job, invitation, user
+from app.api.v1.schemas.users import User, RoleType
+from app.api.v1.schemas.invitations import Invitation, InvitationCreate
+from app.crud import job, invitation
+from app.db.mongodb import InvitationResponseError
+from app.api.v1.endpoints.companies import invitation_http_error
 from app.api.v1.endpoints.users import get_current_user # Keep this for now, will refactor users.py later
+from app.api.v1.endpoints.jobs import idempotent
+from app.core.spreadsheets import spreadsheet_pool, rows_to_xlsx, read_xlsx, XLSX_MEDIA_TYPE, SpreadsheetPoolBusy, SpreadsheetTimeout
 
 router = APIRouter()
 
@@ -27,22 +29,21 @@ async def get_current_dispatcher_or_company(current_user: User = Depends(get_cur
 @router.post("/jobs/", response_model=Job, status_code=status.HTTP_201_CREATED)
 async def create_new_job(
     job_in: JobCreate,
+    idempotency_key: Optional[str] = Header(None),
     current_dispatcher: User = Depends(get_current_dispatcher)
 ):
     print(f"[dispatchers.py] Creating job for dispatcher ID: {current_dispatcher.id}")
     print(f"[dispatchers.py] Dispatcher company_id: {current_dispatcher.company_id}, company_name: {current_dispatcher.company_name}")
-    new_job = await job.create(job_in, current_dispatcher.id, current_dispatcher.company_id, current_dispatcher.company_name)
+    new_job = await idempotent(
+        current_dispatcher.id, idempotency_key, ("create_job", job_in.dict()),
+        lambda: job.create(job_in, current_dispatcher.id, current_dispatcher.company_id, current_dispatcher.company_name)
+    )
     return new_job
 
 @router.get("/jobs/template", summary="Download Job Upload Template (Excel)")
 async def download_job_template(
     current_user: User = Depends(get_current_dispatcher_or_company)
 ):
-    # Create a new workbook and select the active worksheet
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Job Template"
-
     # Define headers for the Excel file
     headers = [
         "company", "transfer_type", "pick_up_date", "pick_up_time", "flight_number",
@@ -51,26 +52,22 @@ async def download_job_template(
         "other_contact_info", "order_number", "total_price", "email", "driver_name",
         "driver_phone", "vehicle_number", "vehicle_type", "is_public", "status"
     ]
-    ws.append(headers)
 
     # Add some example data (optional)
-    ws.append([
+    example_row = [
         "Example Company", "Airport Transfer", "2024-12-25", "14:30", "BR123",
         "John Doe", "0912345678", "Sedan", "2", "Taoyuan Airport", "Taipei City",
         "Extra luggage", "Child seat needed", "", "ORD12345", "1500",
         "john.doe@example.com", "Driver Mike", "0987654321", "ABC-1234", "Sedan",
         "TRUE", "pending"
-    ])
+    ]
 
-    # Save the workbook to a BytesIO object
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
+    excel_file = await spreadsheet_pool.run(rows_to_xlsx, [headers, example_row], "Job Template")
 
     # Return the Excel file as a StreamingResponse
     return StreamingResponse(
         excel_file,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        media_type=XLSX_MEDIA_TYPE,
         headers={
             "Content-Disposition": "attachment; filename=job_template.xlsx"
         }
@@ -85,12 +82,8 @@ async def upload_jobs_from_excel(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file format. Only .xlsx or .xls files are allowed.")
 
     try:
-        # Read the Excel file
-        workbook = load_workbook(filename=BytesIO(await file.read()))
-        sheet = workbook.active
-
-        # Assuming the first row is headers
-        headers = [cell.value for cell in sheet[1]]
+        # Read the Excel file, assuming the first row is headers
+        headers, rows = await spreadsheet_pool.run(read_xlsx, await file.read())
         expected_headers = [
             "company", "transfer_type", "pick_up_date", "pick_up_time", "flight_number",
             "passenger_name", "phone_number", "vehicle_make", "num_of_passenger",
@@ -103,7 +96,7 @@ async def upload_jobs_from_excel(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Missing required headers in Excel file. Expected: {expected_headers}")
 
         created_jobs = []
-        for row_index, row in enumerate(sheet.iter_rows(min_row=2, values_only=True)):
+        for row_index, row in enumerate(rows):
             if not any(row): # Skip empty rows
                 continue
             
@@ -138,6 +131,8 @@ async def upload_jobs_from_excel(
 
     except HTTPException as e:
         raise e
+    except (SpreadsheetPoolBusy, SpreadsheetTimeout): # Answered with 503/504 by the handlers in app.main
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to process Excel file: {e}")
 
@@ -152,25 +147,11 @@ async def accept_invitation(
     invitation_id: str, # Changed from int to str
     current_dispatcher: User = Depends(get_current_dispatcher)
 ):
-    inv = await invitation.get_by_id(invitation_id)
-    if not inv:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invitation not found")
-
-    if inv["invitee_id"] != current_dispatcher.id or inv["invitee_role"] != RoleType.DISPATCHER.value:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to accept this invitation or invitation is not for a dispatcher")
-
-    if inv["status"] != InvitationStatus.PENDING.value:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invitation is not pending")
-
-    # Update invitation status
-    updated_inv = await invitation.update(invitation_id, {"status": InvitationStatus.ACCEPTED.value})
-
-    # Update dispatcher's company_id, company_name, and association status
-    await user.update(current_dispatcher.id, {
-        "company_id": inv["company_id"],
-        "company_name": inv["company_name"],
-        "dispatcher_association_status": DispatcherAssociationStatus.ASSOCIATED
-    })
+    # Accepts the invitation, associates the dispatcher and declines their other pending invitations in one transaction
+    try:
+        updated_inv, _ = await invitation.respond(invitation_id, current_dispatcher.id, RoleType.DISPATCHER, accept=True)
+    except InvitationResponseError as e:
+        raise invitation_http_error(e)
 
     return updated_inv
 
@@ -179,21 +160,10 @@ async def decline_invitation(
     invitation_id: str, # Changed from int to str
     current_dispatcher: User = Depends(get_current_dispatcher)
 ):
-    inv = await invitation.get_by_id(invitation_id)
-    if not inv:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invitation not found")
-
-    if inv["invitee_id"] != current_dispatcher.id or inv["invitee_role"] != RoleType.DISPATCHER.value:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to decline this invitation or invitation is not for a dispatcher")
-
-    if inv["status"] != InvitationStatus.PENDING.value:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invitation is not pending")
-
-    # Update invitation status
-    updated_inv = await invitation.update(invitation_id, {"status": InvitationStatus.DECLINED.value})
-
-    # Update dispatcher's association status to UNASSOCIATED if it was PENDING
-    if current_dispatcher.dispatcher_association_status == DispatcherAssociationStatus.PENDING.value:
-        await user.update(current_dispatcher.id, {"dispatcher_association_status": DispatcherAssociationStatus.UNASSOCIATED})
+    # Declines the invitation and resets a pending dispatcher association in one transaction
+    try:
+        updated_inv, _ = await invitation.respond(invitation_id, current_dispatcher.id, RoleType.DISPATCHER, accept=False)
+    except InvitationResponseError as e:
+        raise invitation_http_error(e)
 
     return updated_inv
\ No newline at end of file
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 
-from app.api.v1.schemas.users import User, RoleType, DriverAssociationStatus
-from app.api.v1.schemas.invitations import Invitation, InvitationCreate, InvitationStatus
-from app.crud import invitation, user
+from app.api.v1.schemas.users import User, RoleType
+from app.api.v1.schemas.invitations import Invitation, InvitationCreate
+from app.crud import invitation
+from app.db.mongodb import InvitationResponseError
+from app.api.v1.endpoints.companies import invitation_http_error
 from app.api.v1.endpoints.users import get_current_user # Keep this for now, will refactor users.py later
 
 router = APIRouter()
@@ -25,25 +27,11 @@ async def accept_invitation(
     invitation_id: str,
     current_driver: User = Depends(get_current_driver)
 ):
-    inv = await invitation.get_by_id(invitation_id)
-    if not inv:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invitation not found")
-
-    if inv["invitee_id"] != current_driver.id or inv["invitee_role"] != RoleType.DRIVER.value:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to accept this invitation or invitation is not for a driver")
-
-    if inv["status"] != InvitationStatus.PENDING.value:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invitation is not pending")
-
-    # Update invitation status
-    await invitation.update(invitation_id, {"status": InvitationStatus.ACCEPTED.value})
-
-    # Update driver's company_id, company_name, and association status
-    updated_user = await user.update(current_driver.id, {
-        "company_id": inv["company_id"],
-        "company_name": inv["company_name"],
-        "driver_association_status": DriverAssociationStatus.ASSOCIATED
-    })
+    # Accepts the invitation, associates the driver and declines their other pending invitations in one transaction
+    try:
+        _, updated_user = await invitation.respond(invitation_id, current_driver.id, RoleType.DRIVER, accept=True)
+    except InvitationResponseError as e:
+        raise invitation_http_error(e)
 
     if not updated_user:
         raise HTTPException(
@@ -58,21 +46,10 @@ async def decline_invitation(
     invitation_id: str,
     current_driver: User = Depends(get_current_driver)
 ):
-    inv = await invitation.get_by_id(invitation_id)
-    if not inv:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invitation not found")
-
-    if inv["invitee_id"] != current_driver.id or inv["invitee_role"] != RoleType.DRIVER.value:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to decline this invitation or invitation is not for a driver")
-
-    if inv["status"] != InvitationStatus.PENDING.value:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invitation is not pending")
-
-    # Update invitation status
-    updated_inv = await invitation.update(invitation_id, {"status": InvitationStatus.DECLINED.value})
-
-    # Update driver's association status to UNASSOCIATED if it was PENDING
-    if current_driver.driver_association_status == DriverAssociationStatus.PENDING.value:
-        await user.update(current_driver.id, {"driver_association_status": DriverAssociationStatus.UNASSOCIATED})
+    # Declines the invitation and resets a pending driver association in one transaction
+    try:
+        updated_inv, _ = await invitation.respond(invitation_id, current_driver.id, RoleType.DRIVER, accept=False)
+    except InvitationResponseError as e:
+        raise invitation_http_error(e)
 
-    return updated_inv
\ No newline at end of file
+    return updated_inv
@@ -1,27 +1,121 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Header
 from typing import List, Optional
 from fastapi.responses import StreamingResponse
-import pandas as pd
-import io
+import asyncio
 
-from app.api.v1.schemas.jobs import Job, JobCreate, JobUpdate, JobStatus, JobSummary, JobType, DispatcherClaimRequest # Add DispatcherClaimRequest
-from app.api.v1.schemas.users import User, RoleType
+from app.api.v1.schemas.jobs import Job, JobCreate, JobUpdate, JobStatus, JobSummary, JobType, DispatcherClaimRequest, JobCounts # Add DispatcherClaimRequest
+from app.api.v1.schemas.jobs import JobBatchDeleteRequest, JobBatchCancelRequest, JobBatchPublishRequest, JobBatchStatusRequest, JobBatchResult, JobLineage, JobCompactionStats
+from app.api.v1.schemas.users import User, RoleType, FieldProfile
 from app.crud.jobs import CRUDJob # Explicitly import CRUDJob
 from app.crud import user
 from app.crud.vehicle import vehicle
 from app.db import mongodb
+from app.db.job_state_machine import JobTransitionError, can_transition
+from app.db.job_compaction import compaction_stats
+from app.db.idempotency import IdempotencyConflict, request_fingerprint, run_idempotent
 from app.api.v1.endpoints.users import get_current_user, get_current_dispatcher, get_current_driver
+from app.core.fast_json import fast_response
+from app.core.streaming import wants_ndjson, ndjson_response
+from app.core.spreadsheets import spreadsheet_pool, jobs_to_xlsx, XLSX_MEDIA_TYPE
+from app.core.mongodb_config import EXPORT_MAX_TIME_MS, LIST_READS, EXPORT_READS
 
 router = APIRouter()
 
 # Create an instance of CRUDJob outside the functions
 crud_job_instance = CRUDJob()
 
+# Upper bound on job_ids accepted by a single batch request
+MAX_BATCH_SIZE = 500
+
+def can_manage_job(job_item: dict, current_user: User) -> bool:
+    # Only the dispatcher who created the job or its company admin may delete or cancel it
+    is_creator = job_item.get("created_by_dispatcher_id") == current_user.id
+    is_company_admin = RoleType.COMPANY.value in current_user.roles and job_item.get("company_id") == current_user.id
+    return is_creator or is_company_admin
+
+def management_filter(current_user: User) -> dict:
+    # Mongo equivalent of can_manage_job, for conditional writes
+    clauses = [{"created_by_dispatcher_id": current_user.id}]
+    if RoleType.COMPANY.value in current_user.roles:
+        clauses.append({"company_id": current_user.id})
+    return {"$or": clauses}
+
+TRANSITION_ERROR_STATUS = {
+    "not_found": status.HTTP_404_NOT_FOUND,
+    "forbidden": status.HTTP_403_FORBIDDEN,
+    "version_mismatch": status.HTTP_412_PRECONDITION_FAILED,
+    "conflict": status.HTTP_409_CONFLICT,
+}
+
+def transition_http_error(error: JobTransitionError) -> HTTPException:
+    return HTTPException(status_code=TRANSITION_ERROR_STATUS[error.reason], detail=error.detail)
+
+async def idempotent(owner_id: str, idempotency_key: Optional[str], request: tuple, operation):
+    """
+    Runs a create-style endpoint body once per Idempotency-Key header; retries
+    get the stored result. `request` identifies the endpoint and its arguments.
+    """
+    try:
+        return await run_idempotent(owner_id, idempotency_key, request_fingerprint(*request), operation)
+    except IdempotencyConflict as e:
+        # Both a request still in progress and a key reused for another request conflict
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=e.detail)
+
+def job_etag(job_item: dict) -> str:
+    return f'"v{job_item.get("version", 0)}"'
+
+def requested_version(if_match: Optional[str], expected_version: Optional[int]) -> Optional[int]:
+    """
+    The job version a conditional write must match, from the If-Match header
+    (an ETag returned by this API) or the expected_version query parameter.
+    """
+    if expected_version is not None:
+        return expected_version
+    if not if_match or if_match.strip() == "*":
+        return None
+    tag = if_match.strip().removeprefix("W/").strip('"')
+    if not (tag.startswith("v") and tag[1:].isdigit()):
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="If-Match does not name a job version.")
+    return int(tag[1:])
+
+async def authorize_batch(job_ids: List[str], current_user: User, is_eligible=None, conflict_detail: str = ""):
+    """
+    Loads and authorizes every job in a batch with one query.
+    Returns the per-id results for rejected jobs and the list of jobs to write.
+    """
+    if len(job_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_BATCH_SIZE} jobs can be processed per request.")
+
+    jobs_by_id = await crud_job_instance.get_many(job_ids)
+    results = {}
+    allowed = []
+    for job_id in dict.fromkeys(job_ids): # De-duplicate, keeping request order
+        job_item = jobs_by_id.get(job_id)
+        if not job_item:
+            results[job_id] = {"job_id": job_id, "outcome": "not_found", "detail": "Job not found."}
+        elif not can_manage_job(job_item, current_user):
+            results[job_id] = {"job_id": job_id, "outcome": "forbidden", "detail": "Not authorized to modify this job."}
+        elif is_eligible and not is_eligible(job_item):
+            results[job_id] = {"job_id": job_id, "outcome": "conflict", "detail": conflict_detail}
+        else:
+            allowed.append(job_item)
+    return results, allowed
+
+def batch_result(job_ids: List[str], results: dict, allowed: List[dict], applied_ids: List[str], conflict_detail: str) -> dict:
+    applied = set(applied_ids)
+    for job_item in allowed:
+        if job_item["id"] in applied:
+            results[job_item["id"]] = {"job_id": job_item["id"], "outcome": "ok"}
+        else: # Changed by another request between authorization and write
+            results[job_item["id"]] = {"job_id": job_item["id"], "outcome": "conflict", "detail": conflict_detail}
+    return {"results": [results[job_id] for job_id in dict.fromkeys(job_ids)]}
+
 @router.get("/export", response_class=StreamingResponse)
 async def export_jobs_to_excel(
     current_user: User = Depends(get_current_user),
     company_id: Optional[str] = None,
     created_by_dispatcher_id: Optional[str] = None,
+    include_archived: bool = False, # Also export jobs moved to the monthly archive collections
     username: Optional[str] = None # Added to accept username query parameter
 ):
     query_params = {}
@@ -33,36 +127,134 @@ async def export_jobs_to_excel(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to export jobs.")
 
 
-    jobs_data = await crud_job_instance.get_all(**query_params)
+    jobs_data = await crud_job_instance.get_all(**query_params, include_archived=include_archived, max_time_ms=EXPORT_MAX_TIME_MS, read_class=EXPORT_READS)
     if not jobs_data:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No jobs found to export.")
 
-    df = pd.DataFrame(jobs_data)
-
-    # Create an in-memory bytes buffer for the Excel file
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Jobs')
-    
-    output.seek(0);
+    output = await spreadsheet_pool.run(jobs_to_xlsx, jobs_data)
 
     headers = {
         'Content-Disposition': 'attachment; filename="jobs_export.xlsx"',
-        'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        'Content-Type': XLSX_MEDIA_TYPE
     }
 
     return StreamingResponse(output, headers=headers)
 
+@router.get("/counts", response_model=JobCounts)
+async def read_job_counts(
+    scope: Optional[str] = None, # "company" or "dispatcher"; defaults to the caller's main role
+    current_user: User = Depends(get_current_user)
+):
+    is_company = RoleType.COMPANY.value in current_user.roles
+    is_dispatcher = RoleType.DISPATCHER.value in current_user.roles
+    if scope is None:
+        scope = "company" if is_company else "dispatcher"
+
+    if scope == "company" and is_company:
+        scope_id = current_user.id
+    elif scope == "company" and is_dispatcher and current_user.company_id:
+        scope_id = current_user.company_id
+    elif scope == "dispatcher" and is_dispatcher:
+        scope_id = current_user.id
+    else:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to read these job counts.")
+
+    # Single document read from the incrementally maintained counters
+    statuses = await crud_job_instance.get_counts(scope, scope_id)
+    return {"scope": scope, "scope_id": scope_id, "statuses": statuses}
+
+@router.get("/compaction/stats", response_model=JobCompactionStats)
+async def read_compaction_stats(current_user: User = Depends(get_current_user)):
+    # Metrics of this worker process's compaction runs; see app/db/job_compaction.py
+    return compaction_stats.as_dict()
+
+@router.post("/batch/delete", response_model=JobBatchResult)
+async def batch_delete_jobs(
+    batch_in: JobBatchDeleteRequest,
+    current_user: User = Depends(get_current_user)
+):
+    results, allowed = await authorize_batch(batch_in.job_ids, current_user)
+    deleted_ids = await crud_job_instance.delete_many(allowed)
+    return batch_result(batch_in.job_ids, results, allowed, deleted_ids, "Job could not be deleted.")
+
+@router.post("/batch/cancel", response_model=JobBatchResult)
+async def batch_cancel_jobs(
+    batch_in: JobBatchCancelRequest,
+    current_user: User = Depends(get_current_user)
+):
+    conflict_detail = "Job cannot be cancelled in its current status."
+    results, allowed = await authorize_batch(
+        batch_in.job_ids, current_user,
+        is_eligible=lambda job_item: can_transition(job_item.get("job_type"), job_item["status"], JobStatus.CANCELLED),
+        conflict_detail=conflict_detail
+    )
+    cancelled_ids = await crud_job_instance.transition_many(allowed, JobStatus.CANCELLED)
+    return batch_result(batch_in.job_ids, results, allowed, cancelled_ids, conflict_detail)
+
+@router.post("/batch/publish", response_model=JobBatchResult)
+async def batch_publish_jobs(
+    batch_in: JobBatchPublishRequest,
+    current_user: User = Depends(get_current_user)
+):
+    # Only pending original jobs can be put on (or taken off) the public board
+    conflict_detail = "Only pending original jobs can be published."
+    results, allowed = await authorize_batch(
+        batch_in.job_ids, current_user,
+        is_eligible=lambda job_item: job_item["status"] == JobStatus.PENDING.value and job_item.get("job_type") == JobType.ORIGINAL.value,
+        conflict_detail=conflict_detail
+    )
+    published_ids = await crud_job_instance.update_many(
+        allowed, {"is_public": batch_in.is_public},
+        precondition={"status": JobStatus.PENDING.value, "job_type": JobType.ORIGINAL.value}
+    )
+    return batch_result(batch_in.job_ids, results, allowed, published_ids, conflict_detail)
+
+@router.post("/batch/status", response_model=JobBatchResult)
+async def batch_update_job_status(
+    batch_in: JobBatchStatusRequest,
+    current_user: User = Depends(get_current_user)
+):
+    conflict_detail = f"Job cannot move to '{batch_in.status.value}' from its current status."
+    results, allowed = await authorize_batch(
+        batch_in.job_ids, current_user,
+        is_eligible=lambda job_item: can_transition(job_item.get("job_type"), job_item["status"], batch_in.status, allow_same=True),
+        conflict_detail=conflict_detail
+    )
+    updated_ids = await crud_job_instance.transition_many(allowed, batch_in.status, allow_same=True)
+    return batch_result(batch_in.job_ids, results, allowed, updated_ids, conflict_detail)
+
 @router.get("/", response_model=List[Job])
 async def read_jobs(
+    request: Request,
+    response: Response,
     assigned_driver_id: Optional[str] = None, # Changed from int to str
     created_by_dispatcher_id: Optional[str] = None, # Changed from int to str
     is_public: Optional[bool] = None,
     status: Optional[JobStatus] = None,
     company_id: Optional[str] = None, # Changed from int to str
-    job_type: Optional[JobType] = None # Add job_type parameter
+    job_type: Optional[JobType] = None, # Add job_type parameter
+    fast: bool = False # Opt-in: serialize trusted documents without per-item validation
 ):
-    print(f"Type of crud_job_instance object: {type(crud_job_instance)}") # Diagnostic print
+    # Large listings and syncs: stream straight from the cursor as newline-delimited JSON
+    if wants_ndjson(request.headers.get("accept")):
+        rows = crud_job_instance.iter_all(assigned_driver_id, created_by_dispatcher_id, is_public, status, company_id, job_type)
+        return ndjson_response(rows, Job, request.headers.get("accept-encoding"))
+
+    # Drivers poll the public board; serve it from memory with conditional GET support
+    # (the driver page also narrows it to job_type=original)
+    if is_public is True and status == JobStatus.PENDING and job_type in (None, JobType.ORIGINAL) and not any([assigned_driver_id, created_by_dispatcher_id, company_id]):
+        public_jobs, etag = await crud_job_instance.get_public_board()
+        if job_type is not None:
+            public_jobs = [job_item for job_item in public_jobs if job_item.get("job_type") == job_type.value]
+            etag = etag[:-1] + f'-{job_type.value}"'
+        if etag in (request.headers.get("if-none-match") or ""):
+            return Response(status_code=304, headers={"ETag": etag})
+        board_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if fast:
+            return fast_response(public_jobs, Job, headers=board_headers)
+        response.headers.update(board_headers)
+        return public_jobs
+
     query_params = {
         "assigned_driver_id": assigned_driver_id,
         "created_by_dispatcher_id": created_by_dispatcher_id,
@@ -73,158 +265,223 @@ async def read_jobs(
     if job_type is not None: # Conditionally pass job_type
         query_params["job_type"] = job_type
     
-    return await crud_job_instance.get_all(**query_params)
+    # Listings tolerate a little replication lag; writes and single-job reads stay on the primary
+    jobs_list = await crud_job_instance.get_all(**query_params, read_class=LIST_READS)
+    if fast:
+        return fast_response(jobs_list, Job)
+    return jobs_list
 
 @router.get("/{job_id}", response_model=Job)
-async def read_job_by_id(job_id: str): # Changed from int to str
+async def read_job_by_id(job_id: str, response: Response): # Changed from int to str
     job_item = await crud_job_instance.get_by_id(job_id)
     if not job_item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    response.headers["ETag"] = job_etag(job_item)
     return job_item
 
+@router.get("/{job_id}/lineage", response_model=JobLineage)
+async def read_job_lineage(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Returns an original job with all of its copied jobs and applications,
+    and how many of them are in each status.
+    """
+    lineage = await crud_job_instance.get_lineage(job_id)
+    if not lineage:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    if not can_manage_job(lineage["job"], current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view this job's lineage.")
+    return lineage
+
 @router.post("/{job_id}/send_to_driver", response_model=Job)
 async def send_job_to_driver(
     job_id: str,
     driver_id: str,
     vehicle_id: str,
+    idempotency_key: Optional[str] = Header(None),
     current_dispatcher: User = Depends(get_current_dispatcher)
 ):
-    original_job = await crud_job_instance.get_by_id(job_id)
-    if not original_job:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Original job not found.")
+    async def send():
+        # Independent lookups run concurrently
+        original_job, target_driver, driver_vehicles = await asyncio.gather(
+            crud_job_instance.get_by_id(job_id),
+            user.get_by_id(driver_id, profile=FieldProfile.PICKER.value),
+            vehicle.get_all(owner_id=driver_id, profile=FieldProfile.PICKER.value),
+        )
+        if not original_job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Original job not found.")
 
-    # Authorization: Ensure the dispatcher is the creator of the job or from the same company
-    if original_job.get("created_by_dispatcher_id") != current_dispatcher.id and \
-       (original_job.get("company_id") and original_job.get("company_id") != current_dispatcher.company_id):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to send this job.")
+        # Authorization: Ensure the dispatcher is the creator of the job or from the same company
+        if original_job.get("created_by_dispatcher_id") != current_dispatcher.id and \
+           (original_job.get("company_id") and original_job.get("company_id") != current_dispatcher.company_id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to send this job.")
 
-    # Check if the driver exists and belongs to the same company (if applicable)
-    target_driver = await user.get_by_id(driver_id)
-    if not target_driver or RoleType.DRIVER.value not in target_driver.roles:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Driver not found or not a driver.")
+        # Check if the driver exists and belongs to the same company (if applicable)
+        if not target_driver or RoleType.DRIVER.value not in target_driver["roles"]:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Driver not found or not a driver.")
     
-    if original_job.get("company_id") and target_driver.company_id != original_job.get("company_id"):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Driver does not belong to the same company as the job.")
-
-    # Check if the vehicle belongs to the target driver
-    driver_vehicles = await vehicle.get_all(owner_id=driver_id)
-    if not any(v["id"] == vehicle_id for v in driver_vehicles):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Proposed vehicle does not belong to the target driver.")
-
-    copied_job = await crud_job_instance.create_copied_job(
-        original_job,
-        driver_id,
-        vehicle_id,
-        target_driver.name or target_driver.username, # driver_name
-        target_driver.driver_profile.phone_number if target_driver.driver_profile else None # driver_phone
-    )
-    if not copied_job:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create copied job.")
-    return copied_job
+        if original_job.get("company_id") and target_driver.get("company_id") != original_job.get("company_id"):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Driver does not belong to the same company as the job.")
+
+        # Check if the vehicle belongs to the target driver
+        selected_vehicle = next((v for v in driver_vehicles if v["id"] == vehicle_id), None)
+        if not selected_vehicle:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Proposed vehicle does not belong to the target driver.")
+
+        driver_profile = target_driver.get("driver_profile") or {}
+        copied_job = await crud_job_instance.create_copied_job(
+            original_job,
+            driver_id,
+            vehicle_id,
+            target_driver.get("name") or target_driver.get("username"), # driver_name
+            driver_profile.get("phone_number"), # driver_phone
+            vehicle_doc=selected_vehicle
+        )
+        if not copied_job:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create copied job.")
+        return copied_job
+
+    return await idempotent(current_dispatcher.id, idempotency_key, ("send_to_driver", job_id, driver_id, vehicle_id), send)
 
 @router.post("/{job_id}/apply", response_model=Job)
 async def apply_for_job(
     job_id: str,
     vehicle_id: str,
+    idempotency_key: Optional[str] = Header(None),
     current_driver: User = Depends(get_current_driver) # Ensure user is a driver
 ):
-    original_job = await crud_job_instance.get_by_id(job_id)
-    if not original_job:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    async def apply():
+        original_job, driver_vehicles = await asyncio.gather(
+            crud_job_instance.get_by_id(job_id),
+            vehicle.get_all(owner_id=current_driver.id, profile=FieldProfile.PICKER.value),
+        )
+        if not original_job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+
+        if original_job.get("is_public") != True or original_job.get("status") != JobStatus.PENDING.value:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Job is not a public pending job and cannot be applied for.")
+
+        # Check if the proposed vehicle belongs to the current driver
+        selected_vehicle = next((v for v in driver_vehicles if v["id"] == vehicle_id), None)
+        if not selected_vehicle:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Proposed vehicle does not belong to you.")
+
+        # Create a job application (a special type of copied job)
+        job_application = await crud_job_instance.create_job_application(
+            original_job,
+            current_driver.id,
+            vehicle_id,
+            current_driver.name or current_driver.username, # driver_name
+            current_driver.driver_profile.phone_number if current_driver.driver_profile else None, # driver_phone
+            vehicle_doc=selected_vehicle
+        )
 
-    if original_job.get("is_public") != True or original_job.get("status") != JobStatus.PENDING.value:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Job is not a public pending job and cannot be applied for.")
-
-    # Check if the proposed vehicle belongs to the current driver
-    driver_vehicles = await vehicle.get_all(owner_id=current_driver.id)
-    if not any(v["id"] == vehicle_id for v in driver_vehicles):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Proposed vehicle does not belong to you.")
-
-    # Create a job application (a special type of copied job)
-    job_application = await crud_job_instance.create_job_application(
-        original_job,
-        current_driver.id,
-        vehicle_id,
-        current_driver.name or current_driver.username, # driver_name
-        current_driver.driver_profile.phone_number if current_driver.driver_profile else None # driver_phone
-    )
+        if not job_application:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create job application.")
 
-    if not job_application:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create job application.")
+        return job_application
 
-    return job_application
+    return await idempotent(current_driver.id, idempotency_key, ("apply", job_id, vehicle_id), apply)
 
 @router.post("/{job_id}/dispatcher_claim", response_model=Job)
 async def dispatcher_claim_public_job(
     job_id: str,
     claim_request: DispatcherClaimRequest,
+    idempotency_key: Optional[str] = Header(None),
     current_dispatcher: User = Depends(get_current_dispatcher)
 ):
     """
     Allows a dispatcher to claim a public job and assign it to a driver
     from their own company.
     """
-    # 1. Get the original job and verify it's a public pending job
-    original_job = await crud_job_instance.get_by_id(job_id)
-    if not original_job:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
-    if not original_job.get("is_public") or original_job.get("status") != JobStatus.PENDING.value:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Job is not a public pending job.")
-
-    # 2. Verify the dispatcher belongs to a company
-    if not current_dispatcher.company_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Dispatcher is not associated with a company.")
-
-    # 3. Get the selected driver and verify they belong to the same company
-    target_driver = await user.get_by_id(claim_request.driver_id)
-    if not target_driver or RoleType.DRIVER.value not in target_driver['roles']:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Selected user is not a valid driver.")
-    if target_driver.get('company_id') != current_dispatcher.company_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Selected driver does not belong to your company.")
-
-    # 4. Verify the selected vehicle belongs to the driver OR the dispatcher
-    vehicle_to_check = await vehicle.get_by_id(claim_request.vehicle_id)
-    if not vehicle_to_check:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Selected vehicle not found.")
+    async def claim():
+        # Load the job, driver and vehicle concurrently
+        original_job, target_driver, vehicle_to_check = await asyncio.gather(
+            crud_job_instance.get_by_id(job_id),
+            user.get_by_id(claim_request.driver_id, profile=FieldProfile.PICKER.value),
+            vehicle.get_by_id(claim_request.vehicle_id, profile=FieldProfile.PICKER.value),
+        )
+
+        # 1. Verify the original job is a public pending job
+        if not original_job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+        if not original_job.get("is_public") or original_job.get("status") != JobStatus.PENDING.value:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Job is not a public pending job.")
+
+        # 2. Verify the dispatcher belongs to a company
+        if not current_dispatcher.company_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Dispatcher is not associated with a company.")
+
+        # 3. Verify the selected driver belongs to the same company
+        if not target_driver or RoleType.DRIVER.value not in target_driver['roles']:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Selected user is not a valid driver.")
+        if target_driver.get('company_id') != current_dispatcher.company_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Selected driver does not belong to your company.")
+
+        # 4. Verify the selected vehicle belongs to the driver OR the dispatcher
+        if not vehicle_to_check:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Selected vehicle not found.")
     
-    is_driver_vehicle = vehicle_to_check.get("owner_id") == claim_request.driver_id
-    is_dispatcher_vehicle = vehicle_to_check.get("owner_id") == current_dispatcher.id
+        is_driver_vehicle = vehicle_to_check.get("owner_id") == claim_request.driver_id
+        is_dispatcher_vehicle = vehicle_to_check.get("owner_id") == current_dispatcher.id
     
-    if not (is_driver_vehicle or is_dispatcher_vehicle):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Selected vehicle does not belong to the selected driver or to you.")
-
-    # 5. Create a copied job assigned to the driver
-    driver_profile = target_driver.get('driver_profile') or {}
-    copied_job = await crud_job_instance.create_copied_job(
-        original_job=original_job,
-        driver_id=claim_request.driver_id,
-        vehicle_id=claim_request.vehicle_id,
-        driver_name=target_driver.get('name') or target_driver.get('username'),
-        driver_phone=driver_profile.get("phone_number")
-    )
+        if not (is_driver_vehicle or is_dispatcher_vehicle):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Selected vehicle does not belong to the selected driver or to you.")
+
+        # 5. Create a copied job assigned to the driver
+        driver_profile = target_driver.get('driver_profile') or {}
+        copied_job = await crud_job_instance.create_copied_job(
+            original_job=original_job,
+            driver_id=claim_request.driver_id,
+            vehicle_id=claim_request.vehicle_id,
+            driver_name=target_driver.get('name') or target_driver.get('username'),
+            driver_phone=driver_profile.get("phone_number"),
+            vehicle_doc=vehicle_to_check
+        )
+
+        if not copied_job:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create copied job for driver.")
 
-    if not copied_job:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create copied job for driver.")
+        return copied_job
 
-    return copied_job
+    return await idempotent(current_dispatcher.id, idempotency_key, ("dispatcher_claim", job_id, claim_request.dict()), claim)
 
 @router.put("/{job_id}", response_model=Job)
 async def update_job(
     job_id: str, # Changed from int to str
     job_in: JobUpdate,
+    response: Response,
+    expected_version: Optional[int] = None,
+    if_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user) # Any logged in user can update for now
 ):
-    existing_job = await crud_job_instance.get_by_id(job_id)
-    if not existing_job:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
-    
     # Basic authorization: only dispatcher who created it or admin can update
     # For simplicity, allowing any logged-in user to update for now.
     # In a real app, you'd add more granular checks.
 
-    updated_job = await crud_job_instance.update(job_id, job_in);
+    version = requested_version(if_match, expected_version)
+    if job_in.status is not None:
+        # Status changes go through the state machine; the form resends the current status unchanged
+        other_fields = job_in.dict(exclude_unset=True, exclude={"status"})
+        try:
+            updated_job = await crud_job_instance.transition(job_id, job_in.status, extra_set=other_fields, allow_same=True, expected_version=version)
+        except JobTransitionError as e:
+            raise transition_http_error(e)
+        response.headers["ETag"] = job_etag(updated_job)
+        return updated_job
+
+    updated_job = await crud_job_instance.update(job_id, job_in, expected_version=version);
     if not updated_job:
+        # Only look the job up again to tell a missing job from a stale version
+        existing_job = await crud_job_instance.get_by_id(job_id)
+        if not existing_job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+        if version is not None and existing_job["version"] != version:
+            raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=f"Job has been modified (now at version {existing_job['version']}).")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update job")
+    response.headers["ETag"] = job_etag(updated_job)
     return updated_job
 
 @router.delete("/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -237,10 +494,7 @@ async def delete_job(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
 
     # Authorization: Only the dispatcher who created the job or a company admin can delete it.
-    is_creator = job_item.get("created_by_dispatcher_id") == current_user.id
-    is_company_admin = RoleType.COMPANY.value in current_user.roles and job_item.get("company_id") == current_user.id
-
-    if not (is_creator or is_company_admin):
+    if not can_manage_job(job_item, current_user):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this job.")
 
     deleted = await crud_job_instance.delete(job_id);
@@ -273,7 +527,7 @@ async def accept_copied_job(
     if copied_job_item.get("status") not in [JobStatus.PENDING_ACCEPTANCE.value, JobStatus.APPLICATION_REQUESTED.value]:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Job is not in pending acceptance or application requested status.")
 
-    updated_original_job = await crud_job_instance.accept_copied_job(copied_job_id, copied_job_item.get("assigned_driver_id"));
+    updated_original_job = await crud_job_instance.accept_copied_job(copied_job_id, copied_job_item.get("assigned_driver_id"), copied_job_item);
 
     if not updated_original_job:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to accept job. It might have been accepted by another driver or already assigned.")
@@ -342,32 +596,18 @@ async def delete_driver_application(
 @router.put("/{job_id}/cancel", response_model=Job)
 async def cancel_job(
     job_id: str,
+    response: Response,
+    expected_version: Optional[int] = None,
+    if_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
-    job_item = await crud_job_instance.get_by_id(job_id)
-    if not job_item:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
-
     # Authorization: Only the dispatcher who created the job or a company admin can cancel it.
-    is_creator = job_item.get("created_by_dispatcher_id") == current_user.id
-    is_company_admin = RoleType.COMPANY.value in current_user.roles and job_item.get("company_id") == current_user.id
-
-    if not (is_creator or is_company_admin):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to cancel this job.")
-
-    if job_item["status"] == JobStatus.COMPLETED.value:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Job is already completed.")
-
-    if job_item["status"] == JobStatus.CANCELLED.value:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Job has been cancelled.")
-
-    # Update job status to cancelled
-    job_update_data = JobUpdate(
-        status=JobStatus.CANCELLED
-    )
-    updated_job = await crud_job_instance.update(job_id, job_update_data);
-
-    if not updated_job:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to cancel job.")
-
-    return updated_job
\ No newline at end of file
+    try:
+        cancelled_job = await crud_job_instance.transition(
+            job_id, JobStatus.CANCELLED, scope_filter=management_filter(current_user),
+            expected_version=requested_version(if_match, expected_version)
+        )
+    except JobTransitionError as e:
+        raise transition_http_error(e)
+    response.headers["ETag"] = job_etag(cancelled_job)
+    return cancelled_job
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from typing import List
+import asyncio
+import os
+
+from app.api.v1.schemas.users import User
+from app.api.v1.endpoints.users import get_current_user
+from app.core.loop_monitor import loop_monitor
+from app.core import request_profiler
+from app.crud import user
+
+router = APIRouter()
+
+# Comma-separated usernames allowed to read operational diagnostics (stack traces, route timings)
+OPS_USERNAMES = {name.strip() for name in os.getenv("OPS_USERNAMES", "").split(",") if name.strip()}
+
+async def is_operator(username: str) -> bool:
+    # Used by the request profiler, which runs before the endpoint's own dependencies
+    return username in OPS_USERNAMES and await user.get_by_username(username) is not None
+
+# Dependency to check if the current user is an operator
+async def get_current_operator(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.username not in OPS_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only operators can perform this action")
+    return current_user
+
+@router.get("/metrics")
+async def read_metrics(current_operator: User = Depends(get_current_operator)):
+    # Request latency per route, event-loop lag and recent blocking calls, for this worker process
+    return loop_monitor.as_dict()
+
+# Requests sent by an operator with the X-Profile-Request header (or ?_profile=1) are profiled;
+# the X-Profile-Id response header names the profile. See app/core/request_profiler.py.
+@router.get("/profiles")
+async def list_request_profiles(current_operator: User = Depends(get_current_operator)) -> List[dict]:
+    return await asyncio.to_thread(request_profiler.list_profiles)
+
+@router.get("/profiles/{profile_id}")
+async def read_request_profile(profile_id: str, current_operator: User = Depends(get_current_operator)):
+    # Summary plus every Mongo command the request issued, with timings
+    profile = await asyncio.to_thread(request_profiler.get_profile, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profile
+
+@router.get("/profiles/{profile_id}/flamegraph", response_class=PlainTextResponse)
+async def read_request_flamegraph(profile_id: str, current_operator: User = Depends(get_current_operator)):
+    # Collapsed stacks: feed to flamegraph.pl or drop into speedscope.app
+    folded = await asyncio.to_thread(request_profiler.get_flamegraph, profile_id)
+    if folded is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return PlainTextResponse(folded, headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'})
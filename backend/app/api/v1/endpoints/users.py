@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 
-from app.api.v1.schemas.users import UserCreate, UserLogin, User, RoleType, UserUpdate, DispatcherAssociationStatus
+from app.api.v1.schemas.users import UserCreate, UserLogin, User, RoleType, UserUpdate, DispatcherAssociationStatus, FieldProfile
 from app.crud import user
 from app.crud.vehicle import vehicle # Import vehicle crud
-from app.db.mongodb import users_collection, user_helper # Import users_collection and user_helper
+from app.core.fast_json import fast_response
 
 router = APIRouter()
 
@@ -62,20 +62,19 @@ async def update_users_me(user_in: UserUpdate, current_user: User = Depends(get_
 async def get_users_by_role(
     role: Optional[RoleType] = None,
     include_vehicles: Optional[bool] = False, # New parameter
+    fast: bool = False, # Opt-in: serialize trusted documents without per-item validation
+    profile: FieldProfile = FieldProfile.FULL, # Pickers send "picker" to skip passwords and role profiles
     current_user: User = Depends(get_current_user) # Ensure user is logged in
 ):
-    query = {}
-    if role:
-        query["roles"] = role.value
-
     all_users = []
-    async for u in users_collection.find(query):
-        user_dict = user_helper(u)
+    for user_dict in await user.get_by_role(role.value if role else None, profile.value):
         if include_vehicles and RoleType.DRIVER.value in user_dict.get("roles", []):
             driver_id = user_dict["id"]
-            driver_vehicles = await vehicle.get_all(owner_id=driver_id)
+            driver_vehicles = await vehicle.get_all(owner_id=driver_id, profile=profile.value)
             if "driver_profile" not in user_dict or user_dict["driver_profile"] is None:
                 user_dict["driver_profile"] = {}
             user_dict["driver_profile"]["vehicles"] = driver_vehicles
-        all_users.append(User(**user_dict))
+        all_users.append(user_dict if fast else User(**user_dict))
+    if fast:
+        return fast_response(all_users, User)
     return all_users
\ No newline at end of file
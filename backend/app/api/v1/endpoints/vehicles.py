@@ -5,6 +5,7 @@ from app.api.v1.schemas.vehicles import Vehicle, VehicleCreate, VehicleUpdate
 from app.api.v1.schemas.users import User, RoleType
 from app.crud.vehicle import vehicle
 from app.api.v1.endpoints.users import get_current_user
+from app.core.fast_json import fast_response
 
 router = APIRouter()
 
@@ -27,6 +28,7 @@ async def create_vehicle(
 @router.get("/", response_model=List[Vehicle])
 async def read_vehicles(
     username: Optional[str] = None, # Accept username query parameter
+    fast: bool = False, # Opt-in: serialize trusted documents without per-item validation
     current_user: User = Depends(get_current_driver_or_company)
 ):
     print(f"[read_vehicles] current_user.id: {current_user.id}")
@@ -34,6 +36,8 @@ async def read_vehicles(
     # Only return vehicles owned by the current user
     vehicles = await vehicle.get_all(owner_id=current_user.id)
     print(f"[read_vehicles] Number of vehicles found for owner {current_user.id}: {len(vehicles)}")
+    if fast:
+        return fast_response(vehicles, Vehicle)
     return [Vehicle(**v) for v in vehicles]
 
 @router.get("/{vehicle_id}", response_model=Vehicle)
@@ -0,0 +1,20 @@
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+class DailyJobCount(BaseModel):
+    date: Optional[str] = None # pick_up_date of the jobs
+    count: int
+
+class RevenueBreakdown(BaseModel):
+    id: Optional[str] = None # Dispatcher or driver user ID
+    name: Optional[str] = None
+    job_count: int
+    revenue: float
+
+class JobAnalytics(BaseModel):
+    company_id: str
+    total_jobs: int
+    status_counts: Dict[str, int] # JobStatus value -> number of original jobs
+    jobs_per_day: List[DailyJobCount]
+    revenue_by_dispatcher: List[RevenueBreakdown]
+    revenue_by_driver: List[RevenueBreakdown]
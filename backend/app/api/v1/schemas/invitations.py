@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 from pydantic import BaseModel
 from .users import RoleType
@@ -24,4 +24,16 @@ class Invitation(InvitationBase):
     id: str
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+class InvitationBatchCreate(BaseModel):
+    invitee_usernames: List[str]
+    invitee_role: RoleType
+
+class InvitationBatchItemResult(BaseModel):
+    invitee_username: str
+    outcome: str # "ok", "not_found", "wrong_role" or "already_associated"
+    detail: Optional[str] = None
+    invitation: Optional[Invitation] = None
+
+class InvitationBatchResult(BaseModel):
+    results: List[InvitationBatchItemResult]
@@ -1,4 +1,5 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
+from datetime import datetime
 from enum import Enum
 from pydantic import BaseModel
 
@@ -105,14 +106,54 @@ class JobUpdate(BaseModel):
 class Job(JobBase):
     id: str # Changed from int to str
     status: JobStatus
+    version: int = 0 # Incremented on every write; send it back as If-Match to detect lost updates
 
     class Config:
         orm_mode = True
         from_attributes = True
 
+class JobLineage(BaseModel):
+    job: Job
+    children: List[Job] # Copied jobs and applications created from `job`
+    status_counts: Dict[str, int] # JobStatus value -> number of children in that status
+
+class JobCompactionStats(BaseModel):
+    runs: int
+    reclaimed_total: int
+    reclaimed_by_rule: Dict[str, int] # "terminal" or "stale_pending" -> documents deleted since startup
+    last_run_at: Optional[datetime] = None
+    last_duration_seconds: float
+    last_reclaimed: int
+    last_docs_per_second: float
+    last_error: Optional[str] = None
+
 class DispatcherClaimRequest(BaseModel):
     driver_id: str
     vehicle_id: str
 
+class JobCounts(BaseModel):
+    scope: str # "company" or "dispatcher"
+    scope_id: str
+    statuses: Dict[str, int] # JobStatus value -> number of jobs currently in that status
+
 class JobBatchDeleteRequest(BaseModel):
-    job_ids: List[str]
\ No newline at end of file
+    job_ids: List[str]
+
+class JobBatchCancelRequest(BaseModel):
+    job_ids: List[str]
+
+class JobBatchPublishRequest(BaseModel):
+    job_ids: List[str]
+    is_public: bool = True # False takes the jobs off the public board
+
+class JobBatchStatusRequest(BaseModel):
+    job_ids: List[str]
+    status: JobStatus
+
+class JobBatchItemResult(BaseModel):
+    job_id: str
+    outcome: str # "ok", "not_found", "forbidden" or "conflict"
+    detail: Optional[str] = None
+
+class JobBatchResult(BaseModel):
+    results: List[JobBatchItemResult]
\ No newline at end of file
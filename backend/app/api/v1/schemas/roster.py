@@ -0,0 +1,33 @@
+from typing import List, Optional
+from pydantic import BaseModel
+from .users import RoleType, DispatcherAssociationStatus, DriverAssociationStatus
+from .role_profiles import DriverProfile
+from .vehicles import Vehicle
+from .invitations import Invitation
+
+class RosterUser(BaseModel):
+    id: str
+    username: str
+    name: Optional[str] = None
+    roles: List[RoleType] = []
+    company_id: Optional[str] = None
+    company_name: Optional[str] = None
+    dispatcher_association_status: Optional[DispatcherAssociationStatus] = None
+    driver_association_status: Optional[DriverAssociationStatus] = None
+    driver_profile: Optional[DriverProfile] = None # Only phone_number is loaded
+
+class RosterDriver(RosterUser):
+    vehicles: List[Vehicle] = []
+
+class RosterCounts(BaseModel):
+    dispatchers: int
+    drivers: int
+    vehicles: int
+    pending_invitations: int
+
+class CompanyRoster(BaseModel):
+    company_id: str
+    dispatchers: List[RosterUser]
+    drivers: List[RosterDriver]
+    pending_invitations: List[Invitation]
+    counts: RosterCounts
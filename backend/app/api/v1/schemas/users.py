@@ -8,6 +8,12 @@ class RoleType(str, Enum):
     DISPATCHER = "dispatcher"
     COMPANY = "company"
 
+class FieldProfile(str, Enum):
+    # Named projections of user and vehicle documents, see USER_PROFILES in app/db/mongodb.py
+    IDENTITY = "identity"
+    PICKER = "picker"
+    FULL = "full"
+
 class DispatcherAssociationStatus(str, Enum):
     ASSOCIATED = "associated"
     UNASSOCIATED = "unassociated"
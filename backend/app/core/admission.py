@@ -0,0 +1,169 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from app.core.cache import TTLCache
+
+# Most rate buckets kept per worker; the least recently used are dropped beyond this
+ADMISSION_MAX_BUCKETS = int(os.getenv("ADMISSION_MAX_BUCKETS", "10000"))
+
+class RouteLimit:
+    """
+    Admission rule for one route (or every route under a prefix).
+    user_rate/company_rate are sustained requests per second with a burst allowance;
+    max_concurrent caps in-flight requests, queueing up to max_queued of them for
+    at most queue_timeout_seconds. Unset limits are not enforced.
+    """
+
+    def __init__(self, method: str, path: str, prefix: bool = False,
+                 user_rate: Optional[float] = None, user_burst: Optional[float] = None,
+                 company_rate: Optional[float] = None, company_burst: Optional[float] = None,
+                 max_concurrent: Optional[int] = None, max_queued: int = 0, queue_timeout_seconds: float = 5.0):
+        self.method = method.upper()
+        self.path = path
+        self.prefix = prefix
+        self.user_rate = user_rate
+        self.user_burst = user_burst or user_rate
+        self.company_rate = company_rate
+        self.company_burst = company_burst or company_rate
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._slots = asyncio.Semaphore(max_concurrent) if max_concurrent else None
+        self._queued = 0
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method != "*" and self.method != method:
+            return False
+        return path.startswith(self.path) if self.prefix else path.rstrip("/") == self.path.rstrip("/")
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def wait_seconds(self) -> float:
+        # Refills the bucket; 0 when a token is available, otherwise the seconds until one is
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware that rate limits requests per user and per company and caps
+    concurrency on expensive routes, answering 429 with Retry-After when a request
+    is shed. The first matching RouteLimit applies. State is per worker process.
+    Requests without a known username are limited by client address instead.
+    """
+
+    def __init__(self, app, limits: List[RouteLimit], company_of: Callable[[str], Awaitable[Optional[str]]]):
+        self.app = app
+        self.limits = limits
+        # username -> company id ("" when the user has no company), None for unknown usernames
+        self.company_of = company_of
+        self._buckets: "OrderedDict[Tuple[int, str], TokenBucket]" = OrderedDict()
+        self._companies = TTLCache(ttl_seconds=300)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = next((limit for limit in self.limits if limit.matches(scope["method"], scope["path"])), None)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = await self._check_rates(limit, scope)
+        if retry_after:
+            await self._reject(send, retry_after, "Too many requests, slow down.")
+            return
+        if limit._slots is None:
+            await self.app(scope, receive, send)
+            return
+
+        if limit._slots.locked():
+            if limit._queued >= limit.max_queued:
+                await self._reject(send, limit.queue_timeout_seconds, "Server is busy with similar requests, try again shortly.")
+                return
+            limit._queued += 1
+            try:
+                await asyncio.wait_for(limit._slots.acquire(), timeout=limit.queue_timeout_seconds)
+            except asyncio.TimeoutError:
+                await self._reject(send, limit.queue_timeout_seconds, "Server is busy with similar requests, try again shortly.")
+                return
+            finally:
+                limit._queued -= 1
+        else:
+            await limit._slots.acquire()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit._slots.release()
+
+    async def _check_rates(self, limit: RouteLimit, scope) -> float:
+        username = parse_qs(scope.get("query_string", b"").decode()).get("username", [None])[0]
+        known, company_id = await self._resolve(username) if username else (False, None)
+        if not known:
+            # Missing or unknown usernames share their client address's bucket, so rotating them does not help
+            client = scope.get("client")
+            requester = f"client:{client[0] if client else 'unknown'}"
+        else:
+            requester = f"user:{username}"
+        keys = []
+        if limit.user_rate:
+            keys.append((requester, limit.user_rate, limit.user_burst))
+        if limit.company_rate and company_id:
+            keys.append((f"company:{company_id}", limit.company_rate, limit.company_burst))
+        buckets = [self._bucket((id(limit), key), rate, burst) for key, rate, burst in keys]
+        # Tokens are only taken when every bucket admits the request
+        wait = max((bucket.wait_seconds() for bucket in buckets), default=0.0)
+        if not wait:
+            for bucket in buckets:
+                bucket.tokens -= 1
+        return wait
+
+    def _bucket(self, key: Tuple[int, str], rate: float, burst: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+            if len(self._buckets) > ADMISSION_MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def _resolve(self, username: str) -> Tuple[bool, Optional[str]]:
+        # (whether the username is a real user, their company id)
+        cached = self._companies.get(username)
+        if cached is not None:
+            return cached
+        try:
+            company_id = await self.company_of(username)
+        except Exception as e:
+            # Not cached, so the next request retries; until then it counts against the client address
+            print(f"[AdmissionControlMiddleware] Could not resolve company for {username}: {e}")
+            return False, None
+        resolved = (company_id is not None, company_id or None)
+        self._companies.set(username, resolved)
+        return resolved
+
+    async def _reject(self, send, retry_after: float, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,118 @@
+import json
+import os
+import sys
+import typing
+from enum import Enum
+from typing import Any, Dict, List, Optional, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError: # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+# When set, every fast response is also rendered through the validated path and mismatches are logged
+FAST_JSON_VERIFY = os.getenv("FAST_JSON_VERIFY", "").lower() in ("1", "true", "yes")
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    # Same settings as FastAPI's JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def _model_fields(model: Type[BaseModel]) -> Dict[str, Any]:
+    # (annotation, default) per field, for both Pydantic v2 and v1
+    fields = getattr(model, "model_fields", None)
+    if fields is not None:
+        return {name: (field.annotation, field.get_default(call_default_factory=True)) for name, field in fields.items()}
+    return {name: (field.outer_type_, field.get_default()) for name, field in model.__fields__.items()}
+
+def _project_value(value: Any, annotation: Any) -> Any:
+    if value is None:
+        return None
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _project_value(value, args[0]) if len(args) == 1 else value
+    if origin in (list, List) and isinstance(value, list):
+        args = typing.get_args(annotation)
+        return [_project_value(item, args[0]) for item in value] if args else value
+    if isinstance(annotation, type):
+        if issubclass(annotation, BaseModel) and isinstance(value, dict):
+            return project(value, annotation)
+        if issubclass(annotation, Enum):
+            return value.value if isinstance(value, Enum) else value
+        # Mirror Pydantic's lax number coercion
+        if annotation is float and isinstance(value, int) and not isinstance(value, bool):
+            return float(value)
+        if annotation is int and isinstance(value, float) and value.is_integer():
+            return int(value)
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def project(doc: Dict[str, Any], model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Shapes a trusted helper dict exactly like `model(**doc)` would serialize:
+    only the model's fields, defaults filled in, enums as values, nested models projected.
+    """
+    return {
+        name: _project_value(doc[name], annotation) if name in doc else _project_value(default, annotation)
+        for name, (annotation, default) in _model_fields(model).items()
+    }
+
+def validated_content(docs: List[Dict[str, Any]], model: Type[BaseModel]) -> Any:
+    # What the response_model path produces for the same documents
+    return jsonable_encoder([model(**doc) for doc in docs])
+
+def matches_validated(docs: List[Dict[str, Any]], model: Type[BaseModel]) -> bool:
+    fast = json.loads(dumps([project(doc, model) for doc in docs]))
+    return fast == json.loads(json.dumps(validated_content(docs, model)))
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def fast_response(docs: List[Dict[str, Any]], model: Type[BaseModel], headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    """
+    Serializes documents built by the db helpers straight to JSON, skipping
+    per-item model validation. Only use for documents read from our own collections.
+    """
+    if FAST_JSON_VERIFY and not matches_validated(docs, model):
+        print(f"[fast_response] Output differs from validated {model.__name__} serialization")
+    return FastJSONResponse(content=[project(doc, model) for doc in docs], headers=headers)
+
+async def _check_collections(limit: int) -> bool:
+    # Compares both paths on real documents from every collection with a fast list endpoint
+    from app.db import mongodb
+    from app.api.v1.schemas.jobs import Job
+    from app.api.v1.schemas.users import User
+    from app.api.v1.schemas.vehicles import Vehicle
+
+    checks = [
+        (mongodb.jobs_collection, mongodb.job_helper, Job),
+        (mongodb.users_collection, mongodb.user_helper, User),
+        (mongodb.vehicles_collection, mongodb.vehicle_helper, Vehicle),
+    ]
+    all_match = True
+    for collection, helper, model in checks:
+        mismatches = 0
+        docs = [helper(doc) async for doc in collection.find().limit(limit)]
+        for doc in docs:
+            if not matches_validated([doc], model):
+                mismatches += 1
+                print(f"{model.__name__} {doc.get('id')}: fast output differs from validated output")
+        print(f"{model.__name__}: {len(docs)} documents checked, {mismatches} mismatches")
+        all_match = all_match and mismatches == 0
+    return all_match
+
+if __name__ == "__main__":
+    # python -m app.core.fast_json [limit]
+    import asyncio
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sys.exit(0 if asyncio.run(_check_collections(limit)) else 1)
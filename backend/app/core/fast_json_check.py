@@ -0,0 +1,112 @@
+"""
+Offline check that the fast JSON path (fast_json.project) produces exactly what the
+validated response_model path would for the documents our list endpoints return.
+Runs built-in sample documents through the db helpers, so it needs no database:
+
+    python -m app.core.fast_json_check
+
+Exits non-zero if any model's output differs. Add a sample here whenever a
+response model or a db helper gains a field. To compare against real data instead,
+run `python -m app.core.fast_json [limit]`.
+"""
+import json
+import sys
+from typing import Any, Dict, List, Tuple, Type
+
+from bson import ObjectId
+from pydantic import BaseModel
+
+from app.core.fast_json import dumps, matches_validated, project, validated_content
+
+def _job_samples() -> List[Dict[str, Any]]:
+    return [
+        { # Original job with every field set
+            "_id": ObjectId(), "company": "ACME Travel", "transfer_type": "pickup", "pick_up_date": "2025-03-01",
+            "pick_up_time": "08:30", "flight_number": "BR61", "passenger_name": "Chen", "phone_number": "0912345678",
+            "vehicle_model": "Sedan", "num_of_passenger": "3", "from_location": "TPE", "to_location": "Taipei 101",
+            "additional_services": "child seat", "special_requirements": "", "other_contact_info": None,
+            "order_number": "A-1001", "total_price": "1800", "email": "chen@example.com", "driver_name": "Lin",
+            "driver_phone": "0987654321", "vehicle_number": "ABC-1234", "vehicle_type": "sedan", "is_public": True,
+            "status": "pending", "assigned_driver_id": None, "created_by_dispatcher_id": str(ObjectId()),
+            "company_id": str(ObjectId()), "company_name": "ACME Travel", "job_type": "original", "version": 4,
+        },
+        { # Legacy job: string id, no version, most optional fields missing
+            "_id": "1700000000.123", "status": "completed", "is_public": False, "job_type": "original",
+        },
+        { # Copied job sent to a driver
+            "_id": ObjectId(), "status": "pending_acceptance", "is_public": False, "job_type": "copied",
+            "original_job_id": str(ObjectId()), "copied_job_id": "copy-1", "assigned_driver_id": str(ObjectId()),
+            "driver_response_status": None, "version": 1,
+        },
+        { # Driver application with a proposed vehicle
+            "_id": ObjectId(), "status": "application_requested", "is_public": True, "job_type": "application",
+            "original_job_id": str(ObjectId()), "assigned_vehicle_id": str(ObjectId()), "version": 0,
+        },
+    ]
+
+def _user_samples() -> List[Dict[str, Any]]:
+    company_id = str(ObjectId())
+    return [
+        { # Associated driver with a partial profile
+            "_id": ObjectId(), "username": "driver1", "password": "hashed", "name": "Lin", "roles": ["driver"],
+            "driver_profile": {"chinese_name": "林", "phone_number": "0987654321"}, "company_id": company_id,
+            "company_name": "ACME Travel", "driver_association_status": "associated",
+        },
+        { # Company with a profile and nothing else
+            "_id": ObjectId(company_id), "username": "acme", "password": "hashed", "roles": ["company"],
+            "company_profile": {"company_name": "ACME Travel", "tax_id": "12345678"},
+        },
+        { # Dispatcher with several roles and a nested bank account
+            "_id": ObjectId(), "username": "disp1", "password": "hashed", "name": None, "roles": ["dispatcher", "driver"],
+            "dispatcher_profile": {"contact_name": "Wang", "bank_account": {"bank_code": "812", "account_number": "0001"}},
+            "company_id": company_id, "dispatcher_association_status": "pending", "driver_association_status": "unassociated",
+        },
+        { # Bare user from an early signup
+            "_id": ObjectId(), "username": "newbie", "password": "hashed", "roles": [],
+        },
+    ]
+
+def _vehicle_samples() -> List[Dict[str, Any]]:
+    return [
+        { # Integer insurance amount exercises the float coercion
+            "_id": ObjectId(), "license_plate": "ABC-1234", "make": "Toyota", "model": "Camry", "capacity": 4,
+            "color": "black", "manufacture_year": "2020-05", "insurance_valid_date": "2026-01-01",
+            "passenger_insurance_amount": 5000000, "owner_id": str(ObjectId()),
+        },
+        {"_id": ObjectId(), "license_plate": "XYZ-9876", "passenger_insurance_amount": 1500000.5},
+        {"_id": ObjectId(), "license_plate": "EMPTY-1"},
+    ]
+
+def _cases() -> List[Tuple[str, List[Dict[str, Any]], Type[BaseModel]]]:
+    # (label, documents as the db helpers return them, response model)
+    from app.db import mongodb
+    from app.api.v1.schemas.jobs import Job
+    from app.api.v1.schemas.users import User
+    from app.api.v1.schemas.vehicles import Vehicle
+
+    cases = [("Job", [mongodb.job_helper(doc) for doc in _job_samples()], Job)]
+    # List endpoints serve users and vehicles through every field profile
+    for profile in mongodb.USER_PROFILES:
+        cases.append((f"User[{profile}]", [mongodb.user_helper(doc, profile) for doc in _user_samples()], User))
+    for profile in mongodb.VEHICLE_PROFILES:
+        cases.append((f"Vehicle[{profile}]", [mongodb.vehicle_helper(doc, profile) for doc in _vehicle_samples()], Vehicle))
+    return cases
+
+def run_checks() -> bool:
+    all_match = True
+    for label, docs, model in _cases():
+        mismatches = 0
+        for doc in docs:
+            if matches_validated([doc], model):
+                continue
+            mismatches += 1
+            fast = json.loads(dumps(project(doc, model)))
+            validated = json.loads(json.dumps(validated_content([doc], model)))[0]
+            differing = sorted(key for key in set(fast) | set(validated) if fast.get(key) != validated.get(key))
+            print(f"{label} {doc.get('id')}: fields differ: {', '.join(differing)}")
+        print(f"{label}: {len(docs)} documents checked, {mismatches} mismatches")
+        all_match = all_match and mismatches == 0
+    return all_match
+
+if __name__ == "__main__":
+    sys.exit(0 if run_checks() else 1)
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional
+
+# How often the event loop is sampled for lag
+LOOP_LAG_SAMPLE_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_SAMPLE_INTERVAL_SECONDS", "0.1"))
+# A callback holding the loop longer than this has its stack captured (0 disables the watchdog)
+BLOCKING_CALL_THRESHOLD_SECONDS = float(os.getenv("BLOCKING_CALL_THRESHOLD_SECONDS", "0.2"))
+BLOCKING_EVENTS_KEPT = int(os.getenv("BLOCKING_EVENTS_KEPT", "50"))
+# Percentiles are computed over the most recent samples only
+LATENCY_WINDOW_SAMPLES = int(os.getenv("LATENCY_WINDOW_SAMPLES", "2048"))
+
+# Request served by the current task; child tasks (e.g. streaming responses) inherit it
+_current_request: ContextVar[Optional[str]] = ContextVar("current_request", default=None)
+
+def _request_of(task: Optional[asyncio.Task]) -> Optional[str]:
+    # Reads another task's context from the watchdog thread (Task.get_context is Python 3.12+)
+    get_context = getattr(task, "get_context", None)
+    return get_context().get(_current_request) if get_context is not None else None
+
+class LatencyWindow:
+    """Most recent durations of one measurement, summarised as percentiles in milliseconds."""
+
+    def __init__(self, size: int = LATENCY_WINDOW_SAMPLES):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+        def percentile(fraction: float) -> float:
+            return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+        return {
+            "count": self.count,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": ordered[-1] * 1000 if ordered else 0.0,
+        }
+
+class RequestMetrics:
+    """Latency percentiles and error counts per route template, for this worker process."""
+
+    def __init__(self):
+        self.latency: Dict[str, LatencyWindow] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, route: str, status_code: int, seconds: float) -> None:
+        self.latency.setdefault(route, LatencyWindow()).add(seconds)
+        if status_code >= 500:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {route: {**window.summary(), "errors": self.errors.get(route, 0)} for route, window in sorted(self.latency.items())}
+
+class LoopMonitor:
+    """
+    Measures event-loop lag with a task that sleeps for a fixed interval and records how
+    late it wakes up. A watchdog thread notices when that task stops waking up at all and
+    captures the loop thread's stack and the request it was serving, so the blocking code
+    is named while it is still running.
+    """
+
+    def __init__(self, interval_seconds: float, threshold_seconds: float, events_kept: int):
+        self.interval_seconds = interval_seconds
+        self.threshold_seconds = threshold_seconds
+        self.lag = LatencyWindow()
+        self.blocking_events: Deque[Dict[str, Any]] = deque(maxlen=events_kept)
+        self.requests = RequestMetrics()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        self._open_event: Optional[Dict[str, Any]] = None
+        self._sampler: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._sampler = asyncio.create_task(self._sample())
+        if self.threshold_seconds > 0:
+            threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            await asyncio.gather(self._sampler, return_exceptions=True)
+            self._sampler = None
+
+    async def _sample(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            now = time.monotonic()
+            lag = max(0.0, now - self._heartbeat - self.interval_seconds)
+            self._heartbeat = now
+            self.lag.add(lag)
+            if self._open_event is not None:
+                # The watchdog saw the block start; now that it is over, record how long it lasted
+                self._open_event["blocked_ms"] = lag * 1000
+                self._open_event = None
+
+    def _watch(self) -> None:
+        reported_heartbeat = None
+        while not self._stopped.wait(self.threshold_seconds / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval_seconds
+            if blocked < self.threshold_seconds or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+            self._capture(blocked)
+
+    def _capture(self, blocked_seconds: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        task = asyncio.current_task(self._loop)
+        event = {
+            "at": datetime.now(timezone.utc),
+            "blocked_ms": blocked_seconds * 1000, # Lower bound until the loop wakes up again
+            "route": _request_of(task),
+            "task": task.get_name() if task is not None else None,
+            "stack": traceback.format_stack(frame) if frame is not None else [],
+        }
+        self.blocking_events.append(event)
+        self._open_event = event
+        print(f"[loop_monitor] Event loop blocked for over {event['blocked_ms']:.0f} ms in {event['route'] or 'a background task'}:\n{''.join(event['stack'][-8:])}")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests.as_dict(),
+            "event_loop_lag": self.lag.summary(),
+            "blocking_events": list(self.blocking_events),
+        }
+
+loop_monitor = LoopMonitor(LOOP_LAG_SAMPLE_INTERVAL_SECONDS, BLOCKING_CALL_THRESHOLD_SECONDS, BLOCKING_EVENTS_KEPT)
+
+def route_template(scope) -> str:
+    # "/api/v1/jobs/64f.../lineage" -> "/api/v1/jobs/{job_id}/lineage", keeping ids out of metric names
+    if scope.get("route") is None:
+        return "unmatched"
+    params = {str(value): name for name, value in scope.get("path_params", {}).items()}
+    return "/".join(f"{{{params[segment]}}}" if segment in params else segment for segment in scope["path"].split("/"))
+
+class RequestMetricsMiddleware:
+    """Times every HTTP request by route template and tags it for the blocking-call watchdog."""
+
+    def __init__(self, app, monitor: LoopMonitor = loop_monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current_request.set(f"{scope['method']} {scope['path']}")
+        status_code = 500
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current_request.reset(token)
+            self.monitor.requests.record(f"{scope['method']} {route_template(scope)}", status_code, time.perf_counter() - started)
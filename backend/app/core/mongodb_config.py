@@ -1,32 +1,172 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.request_profiler import mongo_command_recorder
+from pymongo.errors import OperationFailure
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 from dotenv import load_dotenv
+from typing import Any, Awaitable, Callable, Optional
 import os
 
 load_dotenv() # Load environment variables from .env file
 
 MONGO_DETAILS = os.getenv("MONGO_DETAILS")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "driver_manager_db") # Your database name
 
-if not MONGO_DETAILS:
-    raise ValueError("MONGO_DETAILS environment variable not set.")
-
-try:
-    client = AsyncIOMotorClient(MONGO_DETAILS)
-    # No direct ping() for AsyncIOMotorClient, connection is lazy
-    print("MongoDB client initialized (connection is lazy)...")
-    database = client.driver_manager_db # Your database name
-    print(f"Connected to database: {database.name}")
-
-    # Collections
-    users_collection = database.get_collection("users_collection")
-    jobs_collection = database.get_collection("jobs_collection")
-    invitations_collection = database.get_collection("invitations_collection")
-    vehicles_collection = database.get_collection("vehicles_collection")
-    print("MongoDB collections initialized.")
-
-except Exception as e:
-    print(f"Error initializing MongoDB client: {e}")
+# Connection pool and wire settings
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+# zlib ships with Python; zstd and snappy need the zstandard / python-snappy packages
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
+
+# Fail fast instead of hanging when the cluster is unreachable or slow
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "150000"))
+MONGO_PING_TIMEOUT_SECONDS = float(os.getenv("MONGO_PING_TIMEOUT_SECONDS", "2"))
+
+# Server-side time limits (maxTimeMS) per class of query
+INTERACTIVE_MAX_TIME_MS = int(os.getenv("MONGO_INTERACTIVE_MAX_TIME_MS", "5000")) # Request/response reads
+EXPORT_MAX_TIME_MS = int(os.getenv("MONGO_EXPORT_MAX_TIME_MS", "120000")) # Exports, streams and archive reads
+
+# Read routing: each class of query says which replica-set members may answer it.
+# Writes and read-your-writes paths (accept, apply, claim, get-by-id) always use the primary;
+# stale-tolerant heavy reads may go to secondaries. Against a standalone server every
+# *Preferred mode falls back to the primary; to exercise routing locally, run a
+# single-host replica set (`mongod --replSet rs0`, then rs.initiate()) and add
+# ?replicaSet=rs0 to MONGO_DETAILS.
+PRIMARY_READS = "primary"
+LIST_READS = "list" # Job lists and the public board
+ANALYTICS_READS = "analytics" # Company analytics
+EXPORT_READS = "export" # Exports, streamed listings and archive reads
+
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+READ_CLASS_MODES = {
+    PRIMARY_READS: "primary",
+    LIST_READS: os.getenv("MONGO_LIST_READ_PREFERENCE", "secondaryPreferred"),
+    ANALYTICS_READS: os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred"),
+    EXPORT_READS: os.getenv("MONGO_EXPORT_READ_PREFERENCE", "secondaryPreferred"),
+}
+# Secondaries lagging further behind than this are skipped (the server requires at least 90; -1 disables)
+MONGO_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", "90"))
+
+def read_preference_for(read_class: str):
+    """The pymongo read preference for a class of query."""
+    mode = READ_PREFERENCE_MODES[READ_CLASS_MODES[read_class]]
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=MONGO_MAX_STALENESS_SECONDS)
+
+client: Optional[AsyncIOMotorClient] = None
+_database = None
+
+def connect_mongodb() -> None:
+    """Creates the client; the application lifespan calls this on startup."""
+    global client, _database
+    if client is not None:
+        return
+    if not MONGO_DETAILS:
+        raise ValueError("MONGO_DETAILS environment variable not set.")
+    client = AsyncIOMotorClient(
+        MONGO_DETAILS,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        compressors=MONGO_COMPRESSORS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        event_listeners=[mongo_command_recorder], # Only records commands of requests being profiled
+    )
+    _database = client.get_database(MONGO_DB_NAME)
+    print(f"MongoDB client initialized for database: {_database.name}")
+
+def close_mongodb() -> None:
+    global client, _database
+    if client is not None:
+        client.close()
+        print("MongoDB client closed.")
     client = None
-    database = None
-    users_collection = None
-    jobs_collection = None
-    invitations_collection = None
\ No newline at end of file
+    _database = None
+
+async def ping_mongodb(timeout_seconds: float = MONGO_PING_TIMEOUT_SECONDS) -> None:
+    """Raises if the cluster does not answer a ping within `timeout_seconds`."""
+    connect_mongodb()
+    await asyncio.wait_for(client.admin.command("ping"), timeout=timeout_seconds)
+
+def get_database():
+    # Scripts that never run the application lifespan connect on first use
+    connect_mongodb()
+    return _database
+
+# Standalone servers reject sessions in a transaction with IllegalOperation
+ILLEGAL_OPERATION = 20
+_transactions_supported = True
+
+async def run_transaction(operations: Callable[[Any], Awaitable[Any]]) -> Any:
+    """
+    Runs `operations(session)` in a multi-document transaction, retried on transient
+    errors by with_transaction. Standalone servers have no transactions; there
+    `operations(None)` runs without one, so every write in it must stay safe on its own.
+    """
+    global _transactions_supported
+    if _transactions_supported:
+        connect_mongodb()
+        try:
+            async with await client.start_session() as session:
+                return await session.with_transaction(operations)
+        except OperationFailure as e:
+            if e.code != ILLEGAL_OPERATION:
+                raise
+            _transactions_supported = False # The first command failed, so nothing was written
+            print("[run_transaction] Server does not support transactions; running without them.")
+    return await operations(None)
+
+class DatabaseProxy:
+    """Module-level stand-in for the database, resolved once the client exists."""
+
+    def __getattr__(self, attr):
+        return getattr(get_database(), attr)
+
+class CollectionProxy:
+    """Module-level stand-in for a collection, so modules can import it before the client exists."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collection = None
+        self._routed = {}
+        self._bound_to = None
+
+    def _bind(self):
+        database = get_database()
+        if self._bound_to is not database: # First use, or the client was reopened
+            self._collection = database.get_collection(self.name)
+            self._routed = {}
+            self._bound_to = database
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self._bind(), attr)
+
+    def reads(self, read_class: str):
+        """The collection with the read preference of `read_class` (see READ_CLASS_MODES)."""
+        collection = self._bind()
+        if read_class not in self._routed:
+            self._routed[read_class] = collection.with_options(read_preference=read_preference_for(read_class))
+        return self._routed[read_class]
+
+database = DatabaseProxy()
+
+# Collections
+users_collection = CollectionProxy("users_collection")
+jobs_collection = CollectionProxy("jobs_collection")
+invitations_collection = CollectionProxy("invitations_collection")
+vehicles_collection = CollectionProxy("vehicles_collection")
+counters_collection = CollectionProxy("counters_collection") # Per-company / per-dispatcher job status counters
+idempotency_keys_collection = CollectionProxy("idempotency_keys_collection") # Results of requests sent with an Idempotency-Key
@@ -0,0 +1,14 @@
+import asyncio
+from typing import Awaitable, Callable
+
+async def run_periodically(name: str, interval_seconds: float, job: Callable[[], Awaitable[object]]) -> None:
+    """Runs `job` every `interval_seconds` until cancelled, logging failures instead of stopping."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            result = await job()
+            print(f"[{name}] Completed: {result}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[{name}] Failed: {e}")
@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Upper bound on board age; covers writes made by other worker processes
+PUBLIC_BOARD_MAX_AGE_SECONDS = float(os.getenv("PUBLIC_BOARD_MAX_AGE_SECONDS", "30"))
+# How long a reader waits for a refresh before being served the previous board
+PUBLIC_BOARD_REFRESH_TIMEOUT_SECONDS = float(os.getenv("PUBLIC_BOARD_REFRESH_TIMEOUT_SECONDS", "2"))
+
+class PublicJobBoard:
+    """
+    In-memory copy of the public pending jobs that drivers poll.
+    Job writes mark it dirty; the next reader refreshes it once for everybody,
+    and readers are served the previous board while a slow refresh is running.
+    """
+
+    def __init__(self, max_age_seconds: float, refresh_timeout_seconds: float):
+        self.max_age_seconds = max_age_seconds
+        self.refresh_timeout_seconds = refresh_timeout_seconds
+        self.jobs: Optional[List[Dict[str, Any]]] = None
+        self.version = 0 # Bumped whenever the board content changes
+        self.etag: Optional[str] = None
+        self._digest: Optional[str] = None
+        self._dirty = True
+        self._loaded_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    def is_fresh(self) -> bool:
+        return self.jobs is not None and not self._dirty and time.monotonic() - self._loaded_at < self.max_age_seconds
+
+    async def get(self, loader: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> Tuple[List[Dict[str, Any]], str]:
+        if self.is_fresh():
+            return self.jobs, self.etag
+
+        # Single-flight: concurrent readers share one refresh
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh(loader))
+
+        try:
+            if self.jobs is None:
+                await asyncio.shield(self._refresh_task)
+            else:
+                await asyncio.wait_for(asyncio.shield(self._refresh_task), timeout=self.refresh_timeout_seconds)
+        except asyncio.TimeoutError:
+            print(f"[PublicJobBoard] Refresh slower than {self.refresh_timeout_seconds}s, serving board version {self.version}")
+        except Exception as e:
+            if self.jobs is None:
+                raise
+            print(f"[PublicJobBoard] Refresh failed, serving board version {self.version}: {e}")
+        return self.jobs, self.etag
+
+    async def _refresh(self, loader: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> None:
+        # Cleared before loading so a write that lands mid-refresh triggers another one
+        self._dirty = False
+        try:
+            jobs = await loader()
+        except Exception:
+            self._dirty = True
+            raise
+
+        # Content digest keeps the ETag stable across refreshes and worker processes
+        digest = hashlib.sha1(json.dumps(jobs, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        if digest != self._digest:
+            self._digest = digest
+            self.version += 1
+            self.etag = f'"pb-{digest}"'
+        self.jobs = jobs
+        self._loaded_at = time.monotonic()
+
+public_board = PublicJobBoard(PUBLIC_BOARD_MAX_AGE_SECONDS, PUBLIC_BOARD_REFRESH_TIMEOUT_SECONDS)
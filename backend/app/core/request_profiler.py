@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from pymongo import monitoring
+
+# Requests sent with this header (or ?_profile=1) by an operator are profiled
+PROFILE_HEADER = b"x-profile-request"
+PROFILE_QUERY_FLAG = "_profile"
+PROFILE_SAMPLE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_SECONDS", "0.005"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+# Artifacts are files, so any worker on the host can serve a profile another worker recorded
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "request-profiles"))
+PROFILES_KEPT = int(os.getenv("PROFILES_KEPT", "50"))
+
+AWAITING_FRAME = "[awaiting]"
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, username: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.username = username
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.status_code: Optional[int] = None
+        self.stacks: Counter = Counter() # Collapsed stack ("outer;...;inner") -> sample count
+        self.mongo_commands: List[Dict[str, Any]] = []
+        self._pending_commands: Dict[int, Dict[str, Any]] = {}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "username": self.username,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "status_code": self.status_code,
+            "samples": sum(self.stacks.values()),
+            "mongo_command_count": len(self.mongo_commands),
+            "mongo_ms": sum(command["duration_ms"] for command in self.mongo_commands),
+        }
+
+    def collapsed_stacks(self) -> str:
+        # Brendan Gregg's folded format, readable by flamegraph.pl and speedscope
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+_active_profile: ContextVar[Optional[RequestProfile]] = ContextVar("active_profile", default=None)
+
+class MongoCommandRecorder(monitoring.CommandListener):
+    """Records the Mongo commands issued on behalf of a profiled request; a context lookup otherwise."""
+
+    def started(self, event):
+        profile = _active_profile.get()
+        if profile is not None:
+            target = event.command.get(event.command_name) # Collection name for find, aggregate, update, ...
+            profile._pending_commands[event.request_id] = {
+                "command": event.command_name,
+                "database": event.database_name,
+                "collection": target if isinstance(target, str) else None,
+                "started_ms": (time.perf_counter() - profile._started) * 1000,
+            }
+
+    def succeeded(self, event):
+        self._finish(event, ok=True)
+
+    def failed(self, event):
+        self._finish(event, ok=False)
+
+    def _finish(self, event, ok: bool) -> None:
+        profile = _active_profile.get()
+        if profile is None:
+            return
+        command = profile._pending_commands.pop(event.request_id, None)
+        if command is not None:
+            profile.mongo_commands.append({**command, "duration_ms": event.duration_micros / 1000, "ok": ok})
+
+mongo_command_recorder = MongoCommandRecorder()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _thread_stack(frame) -> List[str]:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return labels[::-1]
+
+def _awaiting_stack(task: asyncio.Task) -> List[str]:
+    # Walks the coroutine chain of a suspended task down to the await it is parked on
+    labels = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels + [AWAITING_FRAME]
+
+class _Sampler(threading.Thread):
+    """
+    Samples one request from a separate thread. While the request's task holds the loop
+    the loop thread's stack is recorded; while it is suspended, the await it is parked on,
+    so time spent waiting on Mongo or other I/O shows up in the flame graph too.
+    """
+
+    def __init__(self, profile: RequestProfile, loop: asyncio.AbstractEventLoop, task: asyncio.Task, interval_seconds: float):
+        super().__init__(name=f"profile-{profile.id[:8]}", daemon=True)
+        self.profile = profile
+        self.loop = loop
+        self.task = task
+        self.interval_seconds = interval_seconds
+        self.loop_thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval_seconds):
+            try:
+                running = asyncio.current_task(self.loop)
+                if running is self.task:
+                    frame = sys._current_frames().get(self.loop_thread_id)
+                    stack = _thread_stack(frame) if frame is not None else []
+                elif running is None and not self.task.done():
+                    stack = _awaiting_stack(self.task)
+                else:
+                    continue # The loop is busy with another request
+            except Exception: # The task moved on while it was being inspected; skip this sample
+                continue
+            if stack:
+                self.profile.stacks[";".join(stack)] += 1
+
+def _store(profile: RequestProfile) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    artifacts = {
+        ".folded": profile.collapsed_stacks(),
+        ".json": json.dumps({**profile.summary(), "mongo_commands": profile.mongo_commands}), # Last: its presence marks a complete profile
+    }
+    for suffix, content in artifacts.items():
+        path = os.path.join(PROFILE_DIR, profile.id + suffix)
+        with open(path + ".tmp", "w") as f:
+            f.write(content)
+        os.replace(path + ".tmp", path) # Readers in other workers never see a partial file
+    # Keep the newest PROFILES_KEPT profiles
+    summaries = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")), key=lambda entry: entry.stat().st_mtime)
+    for entry in summaries[:-PROFILES_KEPT]:
+        for suffix in (".json", ".folded"):
+            try:
+                os.remove(entry.path[:-len(".json")] + suffix)
+            except FileNotFoundError:
+                pass
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Summaries of the stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.name.endswith(".json"):
+            with open(entry.path) as f:
+                profile = json.load(f)
+            profile.pop("mongo_commands", None)
+            profiles.append(profile)
+    return sorted(profiles, key=lambda profile: profile["started_at"], reverse=True)
+
+def _profile_path(profile_id: str, suffix: str) -> Optional[str]:
+    if not profile_id.isalnum(): # Ids are uuid hex; anything else could escape PROFILE_DIR
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + suffix)
+    return path if os.path.exists(path) else None
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    path = _profile_path(profile_id, ".json")
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def get_flamegraph(profile_id: str) -> Optional[str]:
+    path = _profile_path(profile_id, ".folded")
+    if path is None:
+        return None
+    with open(path) as f:
+        return f.read()
+
+class RequestProfilerMiddleware:
+    """
+    Profiles individual requests on demand. Only requests carrying the profile header or
+    query flag from an operator are touched; every other request costs one header lookup.
+    The profile id is returned in the X-Profile-Id response header.
+    """
+
+    def __init__(self, app, is_operator: Callable[[str], Awaitable[bool]]):
+        self.app = app
+        self.is_operator = is_operator
+        self.active = 0
+
+    def _requested(self, scope) -> bool:
+        if any(name == PROFILE_HEADER for name, _ in scope.get("headers", [])):
+            return True
+        query_string = scope.get("query_string", b"")
+        return PROFILE_QUERY_FLAG.encode() in query_string and PROFILE_QUERY_FLAG in parse_qs(query_string.decode())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        username = parse_qs(scope.get("query_string", b"").decode()).get("username", [None])[0]
+        if not username or self.active >= PROFILE_MAX_CONCURRENT or not await self.is_operator(username):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], username)
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        self.active += 1
+        token = _active_profile.set(profile)
+        sampler = _Sampler(profile, asyncio.get_running_loop(), asyncio.current_task(), PROFILE_SAMPLE_INTERVAL_SECONDS)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.stopped.set()
+            profile.duration_ms = (time.perf_counter() - profile._started) * 1000
+            _active_profile.reset(token)
+            self.active -= 1
+            try:
+                await asyncio.to_thread(_store, profile)
+            except OSError as e:
+                print(f"[RequestProfilerMiddleware] Could not store profile {profile.id}: {e}")
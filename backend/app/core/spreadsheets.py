@@ -0,0 +1,117 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# pandas and openpyxl take hundreds of milliseconds and tens of MB to import, and only
+# export, upload and the template need them, so they are imported on first use rather
+# than by every worker at boot. `python -m app.core.startup_profile` checks they stay lazy.
+LAZY_MODULES = ("pandas", "openpyxl")
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Spreadsheet parsing and generation is CPU-bound, so it runs in a worker pool instead of on the event loop.
+# "process" sidesteps the GIL; "thread" avoids a second copy of pandas/openpyxl in memory.
+SPREADSHEET_POOL_KIND = os.getenv("SPREADSHEET_POOL_KIND", "process")
+SPREADSHEET_WORKERS = int(os.getenv("SPREADSHEET_WORKERS", "2"))
+# Tasks running or waiting for a worker; beyond this requests are turned away with 503
+SPREADSHEET_MAX_PENDING = int(os.getenv("SPREADSHEET_MAX_PENDING", "8"))
+SPREADSHEET_TASK_TIMEOUT_SECONDS = float(os.getenv("SPREADSHEET_TASK_TIMEOUT_SECONDS", "60"))
+
+class SpreadsheetPoolBusy(Exception):
+    pass
+
+class SpreadsheetTimeout(Exception):
+    pass
+
+class SpreadsheetPool:
+    """
+    Bounded pool for spreadsheet work. The executor is created on first use. A task
+    that times out is abandoned by its request but keeps its slot until the worker
+    finishes it, so slow files cannot pile up beyond max_pending.
+    """
+
+    def __init__(self, kind: str, workers: int, max_pending: int, timeout_seconds: float):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout_seconds = timeout_seconds
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="spreadsheets")
+            else:
+                # spawn, not fork: the API process has an event loop and driver threads running
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _release(self, _future) -> None:
+        self.pending -= 1
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            raise SpreadsheetPoolBusy(f"{self.pending} spreadsheet tasks are already pending.")
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BrokenProcessPool: # A worker died (e.g. out of memory); start a fresh pool
+            self.shutdown() # Reaps the broken pool's management thread and remaining workers
+            future = self._get_executor().submit(func, *args)
+        self.pending += 1
+        # Released when the worker is done rather than when the request gives up, so the slot tracks real work
+        future.add_done_callback(lambda done: loop.call_soon_threadsafe(self._release, done))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            future.cancel() # Only stops tasks that have not started yet
+            raise SpreadsheetTimeout(f"Spreadsheet task took longer than {self.timeout_seconds:.0f}s.")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+spreadsheet_pool = SpreadsheetPool(SPREADSHEET_POOL_KIND, SPREADSHEET_WORKERS, SPREADSHEET_MAX_PENDING, SPREADSHEET_TASK_TIMEOUT_SECONDS)
+
+# The functions below run inside the pool, so they must stay module-level and take/return picklable values
+
+def jobs_to_xlsx(jobs: List[Dict[str, Any]], sheet_name: str = "Jobs") -> BytesIO:
+    """One row per job, one column per field seen on any job."""
+    import pandas as pd
+
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        pd.DataFrame(jobs).to_excel(writer, index=False, sheet_name=sheet_name)
+    output.seek(0)
+    return output
+
+def rows_to_xlsx(rows: Sequence[Sequence[Any]], sheet_name: str) -> BytesIO:
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = sheet_name
+    for row in rows:
+        sheet.append(list(row))
+    output = BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+def read_xlsx(content: bytes) -> Tuple[List[Any], List[Tuple[Any, ...]]]:
+    """Header row and the remaining rows (as value tuples) of the workbook's active sheet."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(filename=BytesIO(content), read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = list(next(rows, ()))
+        return headers, list(rows)
+    finally:
+        workbook.close()
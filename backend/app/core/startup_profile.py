@@ -0,0 +1,99 @@
+"""
+Cold-start profile of the API: import time per module and resident memory after boot.
+
+    python -m app.core.startup_profile [--top 20] [--budget-ms 1000] [--budget-mb 80]
+
+The application is imported in a fresh interpreter (`python -X importtime`), the way a
+uvicorn worker or a Render cold start would. Exits with status 1 when a budget is exceeded
+or a lazily loaded module (see app.core.spreadsheets.LAZY_MODULES) was imported at boot,
+so it can run as a regression check in CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from app.core.spreadsheets import LAZY_MODULES
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RESULT_MARKER = "STARTUP_PROFILE_RESULT "
+
+# Default budgets, with headroom over the measured baseline of ~776 ms / ~56 MB once
+# spreadsheet libraries load lazily; override with STARTUP_BUDGET_MS / STARTUP_BUDGET_MB
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1000"))
+DEFAULT_BUDGET_MB = float(os.getenv("STARTUP_BUDGET_MB", "80"))
+
+# Runs in the child interpreter; prints one marked JSON line after the import
+CHILD_SCRIPT = f"""
+import json, resource, sys, time
+started = time.perf_counter()
+import app.main
+elapsed_ms = (time.perf_counter() - started) * 1000
+max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024 # bytes on macOS, KiB on Linux
+print({RESULT_MARKER!r} + json.dumps({{"import_ms": elapsed_ms, "rss_mb": rss_mb, "modules": sorted(sys.modules)}}))
+"""
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    # "import time:  self [us] | cumulative | imported package" -> (module, self_us, cumulative_us)
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue # Header line
+        entries.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return entries
+
+def self_time_by_package(entries: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for module, self_us, _ in entries:
+        package = module.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+def run_profile() -> Tuple[dict, List[Tuple[str, int, int]]]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    result_line = next((line for line in completed.stdout.splitlines() if line.startswith(RESULT_MARKER)), None)
+    if completed.returncode != 0 or result_line is None:
+        sys.stderr.write(completed.stderr[-4000:])
+        raise SystemExit(f"Importing app.main failed with exit code {completed.returncode}")
+    return json.loads(result_line[len(RESULT_MARKER):]), parse_importtime(completed.stderr)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=20, help="How many modules and packages to list")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Fail when importing the app takes longer (0 disables)")
+    parser.add_argument("--budget-mb", type=float, default=DEFAULT_BUDGET_MB, help="Fail when resident memory after boot is higher (0 disables)")
+    args = parser.parse_args(argv)
+
+    result, entries = run_profile()
+
+    print(f"Import of app.main: {result['import_ms']:.0f} ms, resident memory after boot: {result['rss_mb']:.1f} MB")
+    print("\nSlowest modules (cumulative ms, including their imports):")
+    for module, _, cumulative_us in sorted(entries, key=lambda entry: entry[2], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:9.1f}  {module}")
+    print("\nTop-level packages (self ms, summed over their modules):")
+    for package, self_us in sorted(self_time_by_package(entries).items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:9.1f}  {package}")
+
+    failures = []
+    loaded_lazy = [name for name in LAZY_MODULES if name in result["modules"]]
+    if loaded_lazy:
+        failures.append(f"lazily loaded modules imported at boot: {', '.join(loaded_lazy)}")
+    if args.budget_ms and result["import_ms"] > args.budget_ms:
+        failures.append(f"import took {result['import_ms']:.0f} ms, budget is {args.budget_ms:.0f} ms")
+    if args.budget_mb and result["rss_mb"] > args.budget_mb:
+        failures.append(f"resident memory is {result['rss_mb']:.1f} MB, budget is {args.budget_mb:.0f} MB")
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
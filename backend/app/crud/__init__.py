@@ -1,6 +1,8 @@
 from . import tasks
 from . import invitations
 from app.db import mongodb
+from app.crud import identity_map
+from app.crud.users import user_kind, forget_user
 from app.api.v1.schemas.users import RoleType
 
 # Users
@@ -11,17 +13,27 @@ class CRUDUserMongoDB:
     async def create(self, user_data):
         return await mongodb.create_user_mongodb(user_data)
 
-    async def get_by_id(self, user_id: str):
-        return await mongodb.get_user_by_id_mongodb(user_id)
+    async def get_by_id(self, user_id: str, profile: str = mongodb.FULL_PROFILE):
+        return await identity_map.load(user_kind(profile), user_id, lambda: mongodb.get_user_by_id_mongodb(user_id, profile))
 
     async def update(self, user_id: str, updated_data):
+        forget_user(user_id)
         return await mongodb.update_user_mongodb(user_id, updated_data)
 
-    async def get_dispatchers_by_company_id(self, company_id: str):
-        return await mongodb.get_dispatchers_by_company_id_mongodb(company_id)
+    async def get_many_by_username(self, usernames):
+        return await mongodb.get_users_by_usernames_mongodb(usernames)
 
-    async def get_drivers_by_company_id(self, company_id: str):
-        return await mongodb.get_drivers_by_company_id_mongodb(company_id)
+    async def get_by_role(self, role=None, profile: str = mongodb.FULL_PROFILE):
+        return await mongodb.get_users_by_role_mongodb(role, profile)
+
+    async def get_dispatchers_by_company_id(self, company_id: str, profile: str = mongodb.FULL_PROFILE):
+        return await mongodb.get_dispatchers_by_company_id_mongodb(company_id, profile)
+
+    async def get_drivers_by_company_id(self, company_id: str, profile: str = mongodb.FULL_PROFILE):
+        return await mongodb.get_drivers_by_company_id_mongodb(company_id, profile)
+
+    async def get_company_roster(self, company_id: str):
+        return await mongodb.get_company_roster_mongodb(company_id)
 
 user = CRUDUserMongoDB()
 
@@ -77,6 +89,21 @@ class CRUDInvitationMongoDB:
             company_name=company_name
         )
 
+    async def create_many(self, invitees, invitee_role: RoleType, company_id: str, company_name: str):
+        # Inserts the invitations, then marks every invitee's association as pending in one write
+        new_invitations = await mongodb.create_invitations_mongodb(invitees, invitee_role, company_id, company_name)
+        invitee_ids = [invitee["id"] for invitee in invitees]
+        for invitee_id in invitee_ids:
+            forget_user(invitee_id)
+        if invitee_ids:
+            await mongodb.set_association_pending_mongodb(invitee_ids, invitee_role)
+        return new_invitations
+
+    async def respond(self, invitation_id: str, invitee_id: str, invitee_role: RoleType, accept: bool):
+        # Returns (invitation, invitee); raises mongodb.InvitationResponseError
+        forget_user(invitee_id)
+        return await mongodb.respond_to_invitation_mongodb(invitation_id, invitee_id, invitee_role, accept)
+
     async def update(self, invitation_id: str, updated_data):
         return await mongodb.update_invitation_mongodb(invitation_id, updated_data)
 
@@ -0,0 +1,50 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# (kind, id) -> task loading that entity, for the lifetime of one HTTP request
+_entities: ContextVar[Optional[Dict[Tuple[str, Hashable], asyncio.Future]]] = ContextVar("identity_map", default=None)
+
+async def load(kind: str, entity_id: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Returns the entity from the current request's identity map, loading it once.
+    Concurrent lookups of the same entity share the same query.
+    Outside a request scope this simply calls `loader`.
+    """
+    entities = _entities.get()
+    if entities is None:
+        return await loader()
+    key = (kind, entity_id)
+    future = entities.get(key)
+    if future is None:
+        future = asyncio.ensure_future(loader())
+        entities[key] = future
+    try:
+        return await asyncio.shield(future)
+    except Exception:
+        entities.pop(key, None) # Do not memoize failures
+        raise
+
+def forget(kind: str, entity_id: Optional[Hashable] = None) -> None:
+    # Drop one entity, or every entity of `kind`, after a write
+    entities = _entities.get()
+    if entities is None:
+        return
+    for key in [key for key in entities if key[0] == kind and (entity_id is None or key[1] == entity_id)]:
+        entities.pop(key, None)
+
+class IdentityMapMiddleware:
+    """ASGI middleware that gives every HTTP request its own identity map."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _entities.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _entities.reset(token)
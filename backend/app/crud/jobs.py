@@ -1,44 +1,112 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from app.api.v1.schemas.jobs import JobCreate, Job, JobUpdate, JobStatus, JobType # Import JobType
 from app.db import mongodb
 from app.crud.users import user
 from app.crud.vehicle import vehicle
+from app.core.cache import analytics_cache
+from app.core.mongodb_config import INTERACTIVE_MAX_TIME_MS, PRIMARY_READS, LIST_READS
+from app.core.public_board import public_board
+from app.crud import identity_map
+from app.db import job_state_machine, job_archive
+
+def _forget_jobs() -> None:
+    # Job writes can touch originals and their copies, so drop every memoized job
+    identity_map.forget("job")
+    identity_map.forget("copied_job")
 
 class CRUDJob:
-    async def get_all(self, assigned_driver_id: Optional[str] = None, created_by_dispatcher_id: Optional[str] = None, is_public: Optional[bool] = None, status: Optional[JobStatus] = None, company_id: Optional[str] = None, job_type: Optional[JobType] = None) -> List[Dict[str, Any]]:
+    async def get_all(self, assigned_driver_id: Optional[str] = None, created_by_dispatcher_id: Optional[str] = None, is_public: Optional[bool] = None, status: Optional[JobStatus] = None, company_id: Optional[str] = None, job_type: Optional[JobType] = None, include_archived: bool = False, max_time_ms: int = INTERACTIVE_MAX_TIME_MS, read_class: str = PRIMARY_READS) -> List[Dict[str, Any]]:
         # Convert JobStatus enum to string value for mongodb filter
         status_str = status.value if isinstance(status, JobStatus) else status
         job_type_str = job_type.value if isinstance(job_type, JobType) else job_type
-        return await mongodb.get_jobs_mongodb(assigned_driver_id, created_by_dispatcher_id, is_public, status_str, company_id, job_type_str)
+        jobs = await mongodb.get_jobs_mongodb(assigned_driver_id, created_by_dispatcher_id, is_public, status_str, company_id, job_type_str, max_time_ms, read_class)
+        if include_archived:
+            jobs.extend(await job_archive.get_archived_jobs_mongodb(assigned_driver_id, created_by_dispatcher_id, is_public, status_str, company_id, job_type_str))
+        return jobs
+
+    def iter_all(self, assigned_driver_id: Optional[str] = None, created_by_dispatcher_id: Optional[str] = None, is_public: Optional[bool] = None, status: Optional[JobStatus] = None, company_id: Optional[str] = None, job_type: Optional[JobType] = None) -> AsyncIterator[Dict[str, Any]]:
+        status_str = status.value if isinstance(status, JobStatus) else status
+        job_type_str = job_type.value if isinstance(job_type, JobType) else job_type
+        return mongodb.iter_jobs_mongodb(assigned_driver_id, created_by_dispatcher_id, is_public, status_str, company_id, job_type_str)
+
+    async def get_public_board(self) -> Tuple[List[Dict[str, Any]], str]:
+        # Public pending jobs from the in-memory board, with its ETag
+        return await public_board.get(lambda: self.get_all(is_public=True, status=JobStatus.PENDING, read_class=LIST_READS))
 
     async def get_by_id(self, job_id: str) -> Optional[Dict[str, Any]]:
-        return await mongodb.get_job_by_id_mongodb(job_id)
+        return await identity_map.load("job", job_id, lambda: mongodb.get_job_by_id_mongodb(job_id))
 
     async def get_by_copied_job_id(self, copied_job_id: str) -> Optional[Dict[str, Any]]:
-        return await mongodb.get_job_by_copied_job_id_mongodb(copied_job_id)
+        return await identity_map.load("copied_job", copied_job_id, lambda: mongodb.get_job_by_copied_job_id_mongodb(copied_job_id))
+
+    async def get_many(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await mongodb.get_jobs_by_ids_mongodb(job_ids)
+
+    async def delete_many(self, jobs: List[Dict[str, Any]]) -> List[str]:
+        _forget_jobs()
+        return await mongodb.delete_jobs_mongodb(jobs)
+
+    async def update_many(self, jobs: List[Dict[str, Any]], updated_data: Dict[str, Any], precondition: Optional[Dict[str, Any]] = None) -> List[str]:
+        _forget_jobs()
+        return await mongodb.update_jobs_mongodb(jobs, updated_data, precondition)
 
     async def create(self, job: JobCreate, created_by_dispatcher_id: str, company_id: Optional[str] = None, company_name: Optional[str] = None) -> Dict[str, Any]:
         return await mongodb.create_job_mongodb(job, created_by_dispatcher_id, company_id, company_name)
 
-    async def create_copied_job(self, original_job: Dict[str, Any], driver_id: str, vehicle_id: str, driver_name: str, driver_phone: str) -> Optional[Dict[str, Any]]:
-        return await mongodb.create_copied_job_mongodb(original_job, driver_id, vehicle_id, driver_name, driver_phone)
+    # `vehicle_doc` may be passed when the caller already loaded it, saving a lookup
+    async def create_copied_job(self, original_job: Dict[str, Any], driver_id: str, vehicle_id: str, driver_name: str, driver_phone: str, vehicle_doc: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return await mongodb.create_copied_job_mongodb(original_job, driver_id, vehicle_id, driver_name, driver_phone, vehicle_doc)
+
+    async def create_job_application(self, original_job: Dict[str, Any], driver_id: str, vehicle_id: str, driver_name: str, driver_phone: str, vehicle_doc: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return await mongodb.create_job_application_mongodb(original_job, driver_id, vehicle_id, driver_name, driver_phone, vehicle_doc)
+
+    async def update(self, job_id: str, job_in: JobUpdate, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        _forget_jobs()
+        return await mongodb.update_job_mongodb(job_id, job_in.dict(exclude_unset=True), expected_version)
+
+    async def transition(self, job_id: str, target: JobStatus, scope_filter: Optional[Dict[str, Any]] = None, extra_set: Optional[Dict[str, Any]] = None, allow_same: bool = False, expected_version: Optional[int] = None) -> Dict[str, Any]:
+        _forget_jobs()
+        return await job_state_machine.transition_job_mongodb(job_id, target, scope_filter, extra_set, allow_same, expected_version)
 
-    async def create_job_application(self, original_job: Dict[str, Any], driver_id: str, vehicle_id: str, driver_name: str, driver_phone: str) -> Optional[Dict[str, Any]]:
-        return await mongodb.create_job_application_mongodb(original_job, driver_id, vehicle_id, driver_name, driver_phone)
+    async def transition_many(self, jobs: List[Dict[str, Any]], target: JobStatus, allow_same: bool = False) -> List[str]:
+        _forget_jobs()
+        return await job_state_machine.transition_jobs_mongodb(jobs, target, allow_same)
 
-    async def update(self, job_id: str, job_in: JobUpdate) -> Optional[Dict[str, Any]]:
-        return await mongodb.update_job_mongodb(job_id, job_in.dict(exclude_unset=True))
+    async def get_lineage(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await mongodb.get_job_lineage_mongodb(job_id)
 
     async def delete(self, job_id: str) -> bool:
+        _forget_jobs()
         return await mongodb.delete_job_mongodb(job_id)
 
-    async def accept_copied_job(self, copied_job_id: str, driver_id: str) -> Optional[Dict[str, Any]]:
-        return await mongodb.accept_copied_job_mongodb(copied_job_id, driver_id)
+    async def accept_copied_job(self, copied_job_id: str, driver_id: str, copied_job: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        _forget_jobs()
+        return await mongodb.accept_copied_job_mongodb(copied_job_id, driver_id, copied_job)
 
     async def reject_copied_job(self, copied_job_id: str) -> bool:
+        _forget_jobs()
         return await mongodb.reject_copied_job_mongodb(copied_job_id)
 
     async def delete_driver_application(self, copied_job_id: str, driver_id: str) -> bool:
+        _forget_jobs()
         return await mongodb.delete_driver_application_mongodb(copied_job_id, driver_id)
 
+    async def get_company_analytics(self, company_id: str, include_archived: bool = False) -> Dict[str, Any]:
+        if include_archived:
+            # Not cached: archive reads are rare and the cache is only invalidated by hot writes
+            return await mongodb.get_company_job_analytics_mongodb(company_id, await job_archive.archive_collection_names())
+        cached = analytics_cache.get(company_id)
+        if cached is not None:
+            return cached
+        generation = analytics_cache.generation
+        analytics = await mongodb.get_company_job_analytics_mongodb(company_id)
+        analytics_cache.set(company_id, analytics, generation=generation)
+        return analytics
+
+    async def get_counts(self, scope: str, scope_id: str) -> Dict[str, int]:
+        return await mongodb.get_job_counters_mongodb(scope, scope_id)
+
+    async def rebuild_counters(self) -> int:
+        return await mongodb.rebuild_job_counters_mongodb()
+
 job = CRUDJob()
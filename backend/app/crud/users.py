@@ -1,8 +1,17 @@
 from typing import List, Dict, Any, Optional
 from app.api.v1.schemas.users import UserCreate, User, UserUpdate, RoleType, DispatcherAssociationStatus, DriverAssociationStatus
 from app.db import mongodb
+from app.crud import identity_map
 from pydantic import BaseModel # Import BaseModel to check type
 
+def user_kind(profile: str) -> str:
+    # Identity-map kind of a user read in `profile`; each profile is memoized separately
+    return "user" if profile == mongodb.FULL_PROFILE else f"user:{profile}"
+
+def forget_user(user_id: str) -> None:
+    for profile in mongodb.USER_PROFILES:
+        identity_map.forget(user_kind(profile), user_id)
+
 class CRUDUser:
     async def get_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         return await mongodb.get_user_by_username_mongodb(username)
@@ -10,8 +19,8 @@ class CRUDUser:
     async def create(self, user: UserCreate) -> Dict[str, Any]:
         return await mongodb.create_user_mongodb(user)
 
-    async def get_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
-        return await mongodb.get_user_by_id_mongodb(user_id)
+    async def get_by_id(self, user_id: str, profile: str = mongodb.FULL_PROFILE) -> Optional[Dict[str, Any]]:
+        return await identity_map.load(user_kind(profile), user_id, lambda: mongodb.get_user_by_id_mongodb(user_id, profile))
 
     async def update(self, user_id: str, user_in: UserUpdate) -> Optional[Dict[str, Any]]:
         # Always convert the incoming Pydantic model to a dictionary
@@ -40,12 +49,13 @@ class CRUDUser:
         if "company_profile" in update_data and update_data["company_profile"] is not None and isinstance(update_data["company_profile"], BaseModel):
             update_data["company_profile"] = update_data["company_profile"].dict(exclude_unset=True)
 
+        forget_user(user_id)
         return await mongodb.update_user_mongodb(user_id, update_data)
 
-    async def get_dispatchers_by_company_id(self, company_id: str) -> List[Dict[str, Any]]:
-        return await mongodb.get_dispatchers_by_company_id_mongodb(company_id)
+    async def get_dispatchers_by_company_id(self, company_id: str, profile: str = mongodb.FULL_PROFILE) -> List[Dict[str, Any]]:
+        return await mongodb.get_dispatchers_by_company_id_mongodb(company_id, profile)
 
-    async def get_drivers_by_company_id(self, company_id: str) -> List[Dict[str, Any]]:
-        return await mongodb.get_drivers_by_company_id_mongodb(company_id)
+    async def get_drivers_by_company_id(self, company_id: str, profile: str = mongodb.FULL_PROFILE) -> List[Dict[str, Any]]:
+        return await mongodb.get_drivers_by_company_id_mongodb(company_id, profile)
 
 user = CRUDUser()
\ No newline at end of file
@@ -1,21 +1,35 @@
 from typing import List, Dict, Any, Optional
 from app.api.v1.schemas.vehicles import VehicleCreate, VehicleUpdate
 from app.db import mongodb
+from app.crud import identity_map
+
+def _kind(kind: str, profile: str) -> str:
+    # Each profile is memoized separately
+    return kind if profile == mongodb.FULL_PROFILE else f"{kind}:{profile}"
+
+def _forget(kind: str, entity_id: Optional[str] = None) -> None:
+    for profile in mongodb.VEHICLE_PROFILES:
+        identity_map.forget(_kind(kind, profile), entity_id)
 
 class CRUDVehicle:
-    async def get_all(self, owner_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        return await mongodb.get_vehicles_mongodb(owner_id)
+    async def get_all(self, owner_id: Optional[str] = None, profile: str = mongodb.FULL_PROFILE) -> List[Dict[str, Any]]:
+        return await identity_map.load(_kind("vehicles_by_owner", profile), owner_id, lambda: mongodb.get_vehicles_mongodb(owner_id, profile))
 
-    async def get_by_id(self, vehicle_id: str) -> Optional[Dict[str, Any]]:
-        return await mongodb.get_vehicle_by_id_mongodb(vehicle_id)
+    async def get_by_id(self, vehicle_id: str, profile: str = mongodb.FULL_PROFILE) -> Optional[Dict[str, Any]]:
+        return await identity_map.load(_kind("vehicle", profile), vehicle_id, lambda: mongodb.get_vehicle_by_id_mongodb(vehicle_id, profile))
 
     async def create(self, vehicle: VehicleCreate) -> Dict[str, Any]:
+        _forget("vehicles_by_owner")
         return await mongodb.create_vehicle_mongodb(vehicle)
 
     async def update(self, vehicle_id: str, vehicle_in: VehicleUpdate) -> Optional[Dict[str, Any]]:
+        _forget("vehicle", vehicle_id)
+        _forget("vehicles_by_owner")
         return await mongodb.update_vehicle_mongodb(vehicle_id, vehicle_in.dict(exclude_unset=True))
 
     async def delete(self, vehicle_id: str) -> bool:
+        _forget("vehicle", vehicle_id)
+        _forget("vehicles_by_owner")
         return await mongodb.delete_vehicle_mongodb(vehicle_id)
 
 vehicle = CRUDVehicle()
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional, Tuple
+from pymongo import IndexModel, ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.core.mongodb_config import idempotency_keys_collection
+
+# How long a completed request's result is replayed for its Idempotency-Key
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+# A claim not renewed for this long is presumed dead and its key may be reused.
+# The request holding it renews it every third of this while the operation runs.
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+
+IDEMPOTENCY_KEY_INDEXES = [
+    IndexModel([("created_at", ASCENDING)], name="expire_keys", expireAfterSeconds=IDEMPOTENCY_KEY_TTL_SECONDS),
+]
+
+class IdempotencyConflict(Exception):
+    def __init__(self, reason: str, detail: str):
+        super().__init__(detail)
+        self.reason = reason # "in_progress" or "mismatch"
+        self.detail = detail
+
+def request_fingerprint(*parts: Any) -> str:
+    # Identifies what a key was first used for, so reusing it for another request is caught
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+async def _claim_key(record_id: str, fingerprint: str) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Claims the key for this request. Returns (None, owner token) when the caller should
+    run the operation, or (stored record, None) when a request already completed the key.
+    """
+    now = datetime.now(timezone.utc)
+    token = uuid.uuid4().hex
+    lease_until = now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+    try:
+        await idempotency_keys_collection.insert_one({
+            "_id": record_id, "fingerprint": fingerprint, "state": "in_progress",
+            "owner": token, "lease_until": lease_until, "created_at": now,
+        })
+        return None, token
+    except DuplicateKeyError:
+        pass
+
+    existing = await idempotency_keys_collection.find_one({"_id": record_id})
+    if existing is None: # Expired between the insert and the read
+        return await _claim_key(record_id, fingerprint)
+    if existing["fingerprint"] != fingerprint:
+        raise IdempotencyConflict("mismatch", "Idempotency-Key was already used for a different request.")
+    if existing["state"] == "completed":
+        return existing, None
+
+    # Take over a key whose request died before completing it; its lease stopped being renewed
+    taken_over = await idempotency_keys_collection.find_one_and_update(
+        {"_id": record_id, "state": "in_progress", "$or": [
+            {"lease_until": {"$lt": now}},
+            # Claims written before leases were renewed
+            {"lease_until": {"$exists": False}, "created_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}},
+        ]},
+        {"$set": {"owner": token, "lease_until": lease_until, "created_at": now}}
+    )
+    if taken_over is None:
+        raise IdempotencyConflict("in_progress", "A request with this Idempotency-Key is still being processed.")
+    return None, token
+
+async def _renew_lease(record_id: str, token: str) -> None:
+    # Keeps the claim alive for as long as the operation runs, however long its timeouts are
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+        lease_until = datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+        try:
+            await idempotency_keys_collection.update_one(
+                {"_id": record_id, "state": "in_progress", "owner": token},
+                {"$set": {"lease_until": lease_until}}
+            )
+        except Exception as e:
+            # A blip must not end renewal; the next attempt is still well inside the lease
+            print(f"[_renew_lease] Failed to renew the lease on {record_id}: {e}")
+
+async def run_idempotent(owner_id: str, key: Optional[str], fingerprint: str, operation: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Runs `operation` once per (owner, Idempotency-Key). Retries with the same key get
+    the first result back without running the operation again. Without a key the
+    operation simply runs. Failed operations release the key so they can be retried.
+    """
+    if not key:
+        return await operation()
+
+    record_id = f"{owner_id}:{key}"
+    existing, token = await _claim_key(record_id, fingerprint)
+    if existing is not None:
+        return existing["result"]
+
+    renewer = asyncio.create_task(_renew_lease(record_id, token))
+    try:
+        result = await operation()
+    except BaseException:
+        await idempotency_keys_collection.delete_one({"_id": record_id, "state": "in_progress", "owner": token})
+        raise
+    finally:
+        renewer.cancel()
+        for outcome in await asyncio.gather(renewer, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                print(f"[run_idempotent] Lease renewal for {record_id} failed: {outcome!r}")
+    # Only the current owner may complete the key, so a claim taken over from us keeps its own result
+    completed = await idempotency_keys_collection.update_one(
+        {"_id": record_id, "state": "in_progress", "owner": token},
+        {"$set": {"state": "completed", "result": result}, "$unset": {"owner": "", "lease_until": ""}}
+    )
+    if completed.matched_count == 0:
+        print(f"[run_idempotent] Lost the claim on {record_id} before completing it; result not stored.")
+    return result
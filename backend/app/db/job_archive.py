@@ -0,0 +1,114 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.api.v1.schemas.jobs import JobStatus
+from app.core.mongodb_config import database, EXPORT_MAX_TIME_MS, EXPORT_READS, read_preference_for
+from app.db.mongodb import jobs_collection, job_helper, JOB_INDEXES, _build_jobs_query, _record_job_writes
+
+# Seconds between archival runs (0 disables the worker)
+JOB_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("JOB_ARCHIVE_INTERVAL_SECONDS", "86400"))
+# Completed and cancelled jobs older than this move to the monthly archive collections (0 disables archival)
+JOB_ARCHIVE_RETENTION_DAYS = float(os.getenv("JOB_ARCHIVE_RETENTION_DAYS", "180"))
+# Each run moves at most BATCH_SIZE * MAX_BATCHES jobs
+JOB_ARCHIVE_BATCH_SIZE = int(os.getenv("JOB_ARCHIVE_BATCH_SIZE", "500"))
+JOB_ARCHIVE_MAX_BATCHES = int(os.getenv("JOB_ARCHIVE_MAX_BATCHES", "20"))
+
+ARCHIVE_COLLECTION_PREFIX = "jobs_archive_"
+ARCHIVED_STATUSES = [JobStatus.COMPLETED.value, JobStatus.CANCELLED.value]
+
+def archive_collection_name(job: Dict[str, Any]) -> str:
+    # Jobs are partitioned by the month they reached their final status
+    finished_at = job.get("status_changed_at")
+    if finished_at is None and isinstance(job["_id"], ObjectId):
+        finished_at = job["_id"].generation_time
+    finished_at = finished_at or datetime.now(timezone.utc)
+    return f"{ARCHIVE_COLLECTION_PREFIX}{finished_at:%Y_%m}"
+
+async def archive_collection_names() -> List[str]:
+    """Names of the monthly archive collections, oldest first."""
+    names = await database.list_collection_names(filter={"name": {"$regex": f"^{ARCHIVE_COLLECTION_PREFIX}"}})
+    return sorted(names)
+
+def _archivable_filter(now: datetime) -> Dict[str, Any]:
+    cutoff = now - timedelta(days=JOB_ARCHIVE_RETENTION_DAYS)
+    return {
+        "status": {"$in": ARCHIVED_STATUSES},
+        "$or": [
+            {"status_changed_at": {"$lt": cutoff}},
+            # Written before status_changed_at existed: fall back to the creation time
+            {"status_changed_at": {"$exists": False}, "_id": {"$lt": ObjectId.from_datetime(cutoff)}},
+        ],
+    }
+
+async def _copy_to_archive(collection_name: str, jobs: List[Dict[str, Any]], archived_at: datetime) -> None:
+    archive = database.get_collection(collection_name)
+    try:
+        await archive.insert_many([{**job, "archived_at": archived_at} for job in jobs], ordered=False)
+    except BulkWriteError as e:
+        # Duplicate keys are jobs copied by an earlier run that stopped before deleting them
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+async def archive_jobs_mongodb() -> Dict[str, int]:
+    """
+    Moves completed and cancelled jobs past the retention horizon from jobs_collection
+    into monthly archive collections, in batches. Each batch is copied before it is
+    deleted, so an interrupted run leaves duplicates to skip rather than lost jobs.
+    Returns the number of jobs moved per archive collection.
+    """
+    if JOB_ARCHIVE_RETENTION_DAYS <= 0:
+        return {}
+    now = datetime.now(timezone.utc)
+    archivable = _archivable_filter(now)
+    moved: Dict[str, int] = {}
+    indexed = set(await archive_collection_names())
+
+    for _ in range(JOB_ARCHIVE_MAX_BATCHES):
+        batch = await jobs_collection.find(archivable).limit(JOB_ARCHIVE_BATCH_SIZE).to_list(length=JOB_ARCHIVE_BATCH_SIZE)
+        if not batch:
+            break
+        by_collection: Dict[str, List[Dict[str, Any]]] = {}
+        for job in batch:
+            by_collection.setdefault(archive_collection_name(job), []).append(job)
+        for collection_name, jobs in by_collection.items():
+            if collection_name not in indexed:
+                # Archive reads filter like the hot collection, so give them the same indexes
+                await database.get_collection(collection_name).create_indexes(JOB_INDEXES)
+                indexed.add(collection_name)
+            await _copy_to_archive(collection_name, jobs, now)
+
+        # The filter is re-applied so a job re-opened since it was read stays hot
+        batch_ids = [job["_id"] for job in batch]
+        result = await jobs_collection.delete_many({"$and": [{"_id": {"$in": batch_ids}}, archivable]})
+        still_hot = {job["_id"] async for job in jobs_collection.find({"_id": {"$in": batch_ids}}, {"_id": 1})}
+        # Another worker's run may have archived part of this batch first; it already counted those
+        counted = result.deleted_count == len(batch) - len(still_hot)
+        for collection_name, jobs in by_collection.items():
+            reopened = [job["_id"] for job in jobs if job["_id"] in still_hot]
+            if reopened:
+                await database.get_collection(collection_name).delete_many({"_id": {"$in": reopened}})
+            if counted:
+                moved[collection_name] = moved.get(collection_name, 0) + len(jobs) - len(reopened)
+        if counted:
+            await _record_job_writes(changes=[(job, None) for job in batch if job["_id"] not in still_hot])
+        else:
+            print(f"[archive_jobs_mongodb] {len(batch) - len(still_hot) - result.deleted_count} jobs were archived by another run; counters will be reconciled")
+
+        if len(batch) < JOB_ARCHIVE_BATCH_SIZE:
+            break
+    return moved
+
+async def get_archived_jobs_mongodb(assigned_driver_id: Optional[str] = None, created_by_dispatcher_id: Optional[str] = None, is_public: Optional[bool] = None, status: Optional[str] = None, company_id: Optional[str] = None, job_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Same filters as get_jobs_mongodb, applied to every archive collection, oldest month first.
+    """
+    query = _build_jobs_query(assigned_driver_id, created_by_dispatcher_id, is_public, status, company_id, job_type)
+    jobs = []
+    for collection_name in await archive_collection_names():
+        archive = database.get_collection(collection_name, read_preference=read_preference_for(EXPORT_READS))
+        async for job in archive.find(query).max_time_ms(EXPORT_MAX_TIME_MS):
+            jobs.append(job_helper(job))
+    return jobs
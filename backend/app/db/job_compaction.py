@@ -0,0 +1,115 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from bson import ObjectId
+
+from app.api.v1.schemas.jobs import JobStatus, JobType
+from app.db.mongodb import jobs_collection, CHILD_JOB_TYPES, _record_job_writes
+
+# Seconds between compaction runs (0 disables the worker)
+JOB_COMPACTION_INTERVAL_SECONDS = float(os.getenv("JOB_COMPACTION_INTERVAL_SECONDS", "900"))
+# How long superseded and rejected copies/applications are kept (0 keeps them forever)
+TERMINAL_COPY_RETENTION_DAYS = float(os.getenv("TERMINAL_COPY_RETENTION_DAYS", "7"))
+# How long a copy may sit in pending_acceptance before it is dropped (0 keeps them forever)
+PENDING_COPY_RETENTION_DAYS = float(os.getenv("PENDING_COPY_RETENTION_DAYS", "30"))
+# Each run deletes at most BATCH_SIZE * MAX_BATCHES documents per rule, keeping runs short
+JOB_COMPACTION_BATCH_SIZE = int(os.getenv("JOB_COMPACTION_BATCH_SIZE", "500"))
+JOB_COMPACTION_MAX_BATCHES = int(os.getenv("JOB_COMPACTION_MAX_BATCHES", "20"))
+
+class CompactionStats:
+    """Counters describing the compaction worker, served by GET /jobs/compaction/stats."""
+
+    def __init__(self):
+        self.runs = 0
+        self.reclaimed_total = 0
+        self.reclaimed_by_rule: Dict[str, int] = {}
+        self.last_run_at: Optional[datetime] = None
+        self.last_duration_seconds = 0.0
+        self.last_reclaimed = 0
+        self.last_error: Optional[str] = None
+
+    def record_run(self, started_at: datetime, duration_seconds: float, reclaimed: Dict[str, int], error: Optional[str] = None) -> None:
+        self.runs += 1
+        self.last_run_at = started_at
+        self.last_duration_seconds = duration_seconds
+        self.last_reclaimed = sum(reclaimed.values())
+        self.reclaimed_total += self.last_reclaimed
+        for rule, count in reclaimed.items():
+            self.reclaimed_by_rule[rule] = self.reclaimed_by_rule.get(rule, 0) + count
+        self.last_error = error
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "reclaimed_total": self.reclaimed_total,
+            "reclaimed_by_rule": dict(self.reclaimed_by_rule),
+            "last_run_at": self.last_run_at,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_reclaimed": self.last_reclaimed,
+            "last_docs_per_second": self.last_reclaimed / self.last_duration_seconds if self.last_duration_seconds else 0.0,
+            "last_error": self.last_error,
+        }
+
+compaction_stats = CompactionStats()
+
+def _expiry_rules(now: datetime) -> Dict[str, Dict[str, Any]]:
+    # Rule name -> filter matching the documents it expires
+    rules = {}
+    if TERMINAL_COPY_RETENTION_DAYS > 0:
+        cutoff = now - timedelta(days=TERMINAL_COPY_RETENTION_DAYS)
+        rules["terminal"] = {
+            "job_type": {"$in": CHILD_JOB_TYPES},
+            "status": {"$in": [JobStatus.SUPERSEDED.value, JobStatus.REJECTED.value]},
+            "$or": [
+                {"status_changed_at": {"$lt": cutoff}},
+                # Written before status_changed_at existed: fall back to the creation time
+                {"status_changed_at": {"$exists": False}, "_id": {"$lt": ObjectId.from_datetime(cutoff)}},
+            ],
+        }
+    if PENDING_COPY_RETENTION_DAYS > 0:
+        cutoff = now - timedelta(days=PENDING_COPY_RETENTION_DAYS)
+        rules["stale_pending"] = {
+            "job_type": JobType.COPIED.value,
+            "status": JobStatus.PENDING_ACCEPTANCE.value,
+            "$or": [
+                {"status_changed_at": {"$lt": cutoff}}, # Copies are created in pending_acceptance
+                {"status_changed_at": {"$exists": False}, "_id": {"$lt": ObjectId.from_datetime(cutoff)}},
+            ],
+        }
+    return rules
+
+async def _expire(rule_filter: Dict[str, Any]) -> int:
+    deleted_total = 0
+    projection = {"status": 1, "company_id": 1, "created_by_dispatcher_id": 1}
+    for _ in range(JOB_COMPACTION_MAX_BATCHES):
+        batch = [job async for job in jobs_collection.find(rule_filter, projection).limit(JOB_COMPACTION_BATCH_SIZE)]
+        if not batch:
+            break
+        # The rule is re-applied so a job that changed since it was read is kept
+        result = await jobs_collection.delete_many({"$and": [{"_id": {"$in": [job["_id"] for job in batch]}}, rule_filter]})
+        deleted_total += result.deleted_count
+        if result.deleted_count == len(batch):
+            await _record_job_writes(changes=[(job, None) for job in batch])
+        else:
+            print(f"[compact_job_copies_mongodb] {len(batch) - result.deleted_count} jobs changed during compaction; counters will be reconciled")
+        if len(batch) < JOB_COMPACTION_BATCH_SIZE:
+            break
+    return deleted_total
+
+async def compact_job_copies_mongodb() -> Dict[str, int]:
+    """
+    Deletes copied jobs and applications that are past their retention period.
+    Returns the number of documents reclaimed per rule.
+    """
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    reclaimed: Dict[str, int] = {}
+    try:
+        for rule, rule_filter in _expiry_rules(started_at).items():
+            reclaimed[rule] = await _expire(rule_filter)
+    except Exception as e:
+        compaction_stats.record_run(started_at, time.perf_counter() - started, reclaimed, error=str(e))
+        raise
+    compaction_stats.record_run(started_at, time.perf_counter() - started, reclaimed)
+    return reclaimed
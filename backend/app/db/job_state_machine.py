@@ -0,0 +1,116 @@
+from typing import Any, Dict, List, Optional
+from pymongo import ReturnDocument
+
+from app.api.v1.schemas.jobs import JobStatus, JobType
+from app.db.mongodb import jobs_collection, job_helper, update_jobs_mongodb, CHILD_JOB_TYPES, VERSION_BUMP
+from app.db.mongodb import _children_status_counts, _job_id_candidates, _next_version, _originals_by_id, _record_job_writes, _status_stamp, _version_filter
+
+# Legal status changes per job type: current status -> statuses it may move to.
+# Statuses missing on the left are terminal for that job type.
+TRANSITIONS: Dict[JobType, Dict[JobStatus, List[JobStatus]]] = {
+    JobType.ORIGINAL: {
+        JobStatus.PENDING: [JobStatus.ASSIGNED, JobStatus.CLAIM_REQUESTED, JobStatus.COMPLETED, JobStatus.CANCELLED],
+        JobStatus.CLAIM_REQUESTED: [JobStatus.PENDING, JobStatus.ASSIGNED, JobStatus.CANCELLED],
+        JobStatus.ASSIGNED: [JobStatus.PENDING, JobStatus.COMPLETED, JobStatus.CANCELLED],
+        JobStatus.CANCELLED: [JobStatus.PENDING], # Re-open a cancelled job
+    },
+    JobType.COPIED: {
+        JobStatus.PENDING_ACCEPTANCE: [JobStatus.ACCEPTED, JobStatus.REJECTED, JobStatus.SUPERSEDED, JobStatus.CANCELLED],
+        JobStatus.ACCEPTED: [JobStatus.CANCELLED],
+    },
+    JobType.APPLICATION: {
+        JobStatus.APPLICATION_REQUESTED: [JobStatus.ACCEPTED, JobStatus.REJECTED, JobStatus.SUPERSEDED, JobStatus.CANCELLED],
+        JobStatus.ACCEPTED: [JobStatus.CANCELLED],
+    },
+}
+
+# Moving an original job to one of these statuses moves its copies and applications along
+CASCADING_STATUSES = [JobStatus.CANCELLED]
+
+class JobTransitionError(Exception):
+    def __init__(self, reason: str, detail: str):
+        super().__init__(detail)
+        self.reason = reason # "not_found", "forbidden", "version_mismatch" or "conflict"
+        self.detail = detail
+
+def can_transition(job_type: Optional[str], current_status: str, target: JobStatus, allow_same: bool = False) -> bool:
+    if allow_same and current_status == target.value:
+        return True
+    allowed = TRANSITIONS.get(JobType(job_type or JobType.ORIGINAL.value), {})
+    return any(source.value == current_status and target in targets for source, targets in allowed.items())
+
+def transition_filter(target: JobStatus, allow_same: bool = False) -> Dict[str, Any]:
+    """Mongo filter matching the jobs that may legally move to `target`."""
+    clauses = []
+    for job_type, allowed in TRANSITIONS.items():
+        sources = [source.value for source, targets in allowed.items() if target in targets]
+        if allow_same:
+            sources.append(target.value)
+        if not sources:
+            continue
+        # Jobs written before job_type existed are originals
+        type_match = {"$in": [job_type.value, None]} if job_type == JobType.ORIGINAL else job_type.value
+        clauses.append({"job_type": type_match, "status": {"$in": sources}})
+    return {"$or": clauses} if clauses else {"_id": {"$exists": False}}
+
+async def transition_job_mongodb(job_id: str, target: JobStatus, scope_filter: Optional[Dict[str, Any]] = None, extra_set: Optional[Dict[str, Any]] = None, allow_same: bool = False, expected_version: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Moves a job to `target` in a single find_one_and_update whose filter carries both
+    the caller's authorization scope, the expected version and the legal source statuses.
+    Raises JobTransitionError describing why the job did not match.
+    """
+    set_fields = {key: value.value if isinstance(value, (JobStatus, JobType)) else value for key, value in (extra_set or {}).items()}
+    set_fields = _status_stamp({**set_fields, "status": target.value})
+    id_filter = {"_id": {"$in": _job_id_candidates([job_id])}}
+    conditions = [id_filter, transition_filter(target, allow_same)]
+    if scope_filter:
+        conditions.append(scope_filter)
+    if expected_version is not None:
+        conditions.append(_version_filter(expected_version))
+
+    previous_job = await jobs_collection.find_one_and_update({"$and": conditions}, {"$set": set_fields, **VERSION_BUMP}, return_document=ReturnDocument.BEFORE)
+    if previous_job is None:
+        # Failure path only: work out which part of the precondition did not hold
+        current_job = await jobs_collection.find_one(id_filter, {"status": 1, "version": 1})
+        if not current_job:
+            raise JobTransitionError("not_found", "Job not found.")
+        if scope_filter and not await jobs_collection.find_one({"$and": [id_filter, scope_filter]}, {"_id": 1}):
+            raise JobTransitionError("forbidden", "Not authorized to change this job.")
+        if expected_version is not None and current_job.get("version", 0) != expected_version:
+            raise JobTransitionError("version_mismatch", f"Job has been modified (now at version {current_job.get('version', 0)}).")
+        raise JobTransitionError("conflict", f"Job cannot move from '{current_job['status']}' to '{target.value}'.")
+
+    updated_job = {**previous_job, **set_fields, "version": _next_version(previous_job)}
+    await _record_job_writes(changes=[(previous_job, updated_job)])
+    if previous_job["status"] != target.value:
+        await cascade_to_children_mongodb([updated_job], target)
+    return job_helper(updated_job)
+
+async def transition_jobs_mongodb(jobs: List[Dict[str, Any]], target: JobStatus, allow_same: bool = False) -> List[str]:
+    """
+    Moves many jobs to `target` with one update_many; jobs that are no longer in a
+    legal source status are skipped. Returns the ids of the jobs that were moved.
+    """
+    moved_ids = await update_jobs_mongodb(jobs, {"status": target}, precondition=transition_filter(target, allow_same))
+    moved = set(moved_ids)
+    await cascade_to_children_mongodb([job for job in jobs if job["id"] in moved and job["status"] != target.value], target)
+    return moved_ids
+
+async def cascade_to_children_mongodb(parents: List[Dict[str, Any]], target: JobStatus) -> int:
+    """
+    Moves the open copied jobs and applications of the given original jobs to `target`
+    with one update_many. Returns the number of children moved.
+    """
+    parents_by_id = _originals_by_id(parents)
+    if target not in CASCADING_STATUSES or not parents_by_id:
+        return 0
+    child_filter = {"$and": [
+        {"original_job_id": {"$in": list(parents_by_id)}, "job_type": {"$in": CHILD_JOB_TYPES}},
+        transition_filter(target),
+    ]}
+    counts_by_parent = await _children_status_counts(child_filter)
+    if not counts_by_parent:
+        return 0
+    result = await jobs_collection.update_many(child_filter, {"$set": _status_stamp({"status": target.value}), **VERSION_BUMP})
+    await _record_job_writes(status_shifts=[(parents_by_id[parent_id], counts, target.value) for parent_id, counts in counts_by_parent.items()])
+    return result.modified_count
@@ -1,16 +1,88 @@
-from typing import List, Dict, Any, Optional, Union
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple, Union, AsyncIterator
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, UpdateOne, ReplaceOne, ReturnDocument
 import time # Import time for generating unique IDs
+from datetime import datetime, timezone
 
-from app.core.mongodb_config import users_collection, jobs_collection, invitations_collection, vehicles_collection
+from app.core.mongodb_config import users_collection, jobs_collection, invitations_collection, vehicles_collection, counters_collection, idempotency_keys_collection
+from app.core.mongodb_config import run_transaction, INTERACTIVE_MAX_TIME_MS, EXPORT_MAX_TIME_MS, PRIMARY_READS, ANALYTICS_READS, EXPORT_READS
 from app.api.v1.schemas.users import UserCreate, User, RoleType, DispatcherAssociationStatus, DriverAssociationStatus
 from app.api.v1.schemas.jobs import JobCreate, JobStatus, JobType # Import JobType
 from app.api.v1.schemas.invitations import InvitationCreate, InvitationStatus
 from app.api.v1.schemas.vehicles import VehicleCreate, VehicleUpdate # Import Vehicle schemas
 from pydantic import BaseModel # Import BaseModel for type checking
+from app.core.cache import analytics_cache
+from app.core.public_board import public_board
+from app.db.idempotency import IDEMPOTENCY_KEY_INDEXES
+
+# Statuses whose total_price counts as company revenue
+REVENUE_STATUSES = [JobStatus.ASSIGNED.value, JobStatus.COMPLETED.value]
+
+# Secondary indexes created at startup by ensure_indexes_mongodb
+JOB_INDEXES = [
+    IndexModel([("company_id", ASCENDING), ("job_type", ASCENDING), ("status", ASCENDING)], name="company_type_status"),
+    # Copied jobs and applications of an original, see get_job_lineage_mongodb
+    IndexModel([("original_job_id", ASCENDING), ("status", ASCENDING)], name="lineage"),
+    # Expired copies and applications, see app/db/job_compaction.py
+    IndexModel([("job_type", ASCENDING), ("status", ASCENDING), ("status_changed_at", ASCENDING)], name="compaction"),
+    # Finished jobs past retention, see app/db/job_archive.py
+    IndexModel([("status", ASCENDING), ("status_changed_at", ASCENDING)], name="archive"),
+    # Driver and dispatcher job lists, and the public board
+    IndexModel([("assigned_driver_id", ASCENDING), ("job_type", ASCENDING), ("status", ASCENDING)], name="driver_type_status"),
+    IndexModel([("created_by_dispatcher_id", ASCENDING), ("job_type", ASCENDING), ("status", ASCENDING)], name="dispatcher_type_status"),
+    IndexModel([("is_public", ASCENDING), ("status", ASCENDING), ("job_type", ASCENDING)], name="public_board"),
+    # Accept/reject of copied jobs and applications
+    IndexModel([("copied_job_id", ASCENDING)], name="copied_job_id"),
+]
+USER_INDEXES = [
+    IndexModel([("username", ASCENDING)], name="username"),
+    IndexModel([("company_id", ASCENDING), ("roles", ASCENDING)], name="company_roles"),
+    IndexModel([("roles", ASCENDING)], name="roles"),
+]
+INVITATION_INDEXES = [
+    IndexModel([("invitee_id", ASCENDING), ("invitee_role", ASCENDING), ("status", ASCENDING)], name="invitee_role_status"),
+    # Pending invitations on the company roster
+    IndexModel([("company_id", ASCENDING), ("status", ASCENDING)], name="company_status"),
+]
+VEHICLE_INDEXES = [
+    IndexModel([("owner_id", ASCENDING)], name="owner"),
+]
+
+# Job types created from an original job and linked to it by original_job_id
+CHILD_JOB_TYPES = [JobType.COPIED.value, JobType.APPLICATION.value]
+
+# Named field profiles for user and vehicle reads, pushed down as Mongo projections.
+# "identity" is enough to name and authorize someone, "picker" feeds driver/vehicle
+# pickers and lists, "full" is the whole document (profile pages, login, updates).
+FULL_PROFILE = "full"
+USER_PROFILES = {
+    "identity": ["username", "name", "roles", "company_id"],
+    "picker": [
+        "username", "name", "roles", "company_id", "company_name",
+        "dispatcher_association_status", "driver_association_status", "driver_profile.phone_number",
+    ],
+    FULL_PROFILE: None,
+}
+VEHICLE_PROFILES = {
+    "identity": ["license_plate", "owner_id"],
+    "picker": ["license_plate", "make", "model", "capacity", "color", "owner_id"],
+    FULL_PROFILE: None,
+}
+
+def profile_projection(profiles: Dict[str, Optional[List[str]]], profile: str) -> Optional[Dict[str, int]]:
+    # None fetches the whole document
+    fields = profiles[profile]
+    return {field: 1 for field in fields} if fields is not None else None
+
+def _profiled(doc, fields: List[str]) -> Dict[str, Any]:
+    # Top-level keys of a projected document; "driver_profile.phone_number" comes back as {"driver_profile": {...}}
+    return {"id": str(doc["_id"]), **{key: doc.get(key) for key in dict.fromkeys(field.split(".")[0] for field in fields)}}
 
 # Helper function to convert MongoDB document to Python dict
-def user_helper(user) -> Dict[str, Any]:
+def user_helper(user, profile: str = FULL_PROFILE) -> Dict[str, Any]:
+    if profile != FULL_PROFILE:
+        return _profiled(user, USER_PROFILES[profile])
     return {
         "id": str(user["_id"]),
         "username": user["username"],
@@ -64,6 +136,7 @@ def job_helper(job) -> Dict[str, Any]:
         "copied_job_id": job.get("copied_job_id"), # New field
         "job_type": job.get("job_type"), # New field
         "driver_response_status": job.get("driver_response_status"), # New field
+        "version": job.get("version", 0),
     }
 
 def invitation_helper(invitation) -> Dict[str, Any]:
@@ -77,6 +150,114 @@ def invitation_helper(invitation) -> Dict[str, Any]:
         "status": invitation["status"],
     }
 
+# --- Job Write Bookkeeping ---
+def _counter_keys(job: Optional[Dict[str, Any]]) -> List[str]:
+    # Each job is counted once for its company and once for the dispatcher who created it
+    if not job:
+        return []
+    keys = []
+    if job.get("company_id"):
+        keys.append(f"company:{job['company_id']}")
+    if job.get("created_by_dispatcher_id"):
+        keys.append(f"dispatcher:{job['created_by_dispatcher_id']}")
+    return keys
+
+def _on_public_board(job: Optional[Dict[str, Any]]) -> bool:
+    return bool(job) and job.get("is_public") is True and job.get("status") == JobStatus.PENDING.value
+
+def _add_status_delta(deltas: Dict[str, Dict[str, int]], job: Optional[Dict[str, Any]], job_status: Optional[str], amount: int) -> None:
+    if not job_status:
+        return
+    for key in _counter_keys(job):
+        by_status = deltas.setdefault(key, {})
+        by_status[job_status] = by_status.get(job_status, 0) + amount
+
+async def _record_job_writes(changes=(), status_shifts=()) -> None:
+    """
+    Keeps derived job state in step with a write: invalidates cached analytics,
+    marks the public board dirty and applies $inc deltas to the status counters.
+    `changes` holds (before, after) document pairs, either side None for inserts/deletes.
+    `status_shifts` holds (job, {old_status: count}, new_status) for update_many writes
+    where all matched jobs share the company and dispatcher of `job`.
+    """
+    deltas: Dict[str, Dict[str, int]] = {}
+    touched = []
+    for before, after in changes:
+        touched.extend([before, after])
+        if _on_public_board(before) or _on_public_board(after):
+            public_board.mark_dirty()
+        _add_status_delta(deltas, before, before.get("status") if before else None, -1)
+        _add_status_delta(deltas, after, after.get("status") if after else None, 1)
+    for job, old_counts, new_status in status_shifts:
+        touched.append(job)
+        for old_status, count in old_counts.items():
+            _add_status_delta(deltas, job, old_status, -count)
+            _add_status_delta(deltas, job, new_status, count)
+
+    for job in touched:
+        if job and job.get("company_id"):
+            analytics_cache.invalidate(job["company_id"])
+
+    operations = []
+    for key, by_status in deltas.items():
+        increments = {f"statuses.{job_status}": amount for job_status, amount in by_status.items() if amount}
+        if increments:
+            operations.append(UpdateOne({"_id": key}, {"$inc": increments}, upsert=True))
+    if operations:
+        try:
+            await counters_collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Counters are derived data; rebuild_job_counters_mongodb repairs any drift
+            print(f"[_record_job_writes] Failed to update job counters: {e}")
+
+async def _status_counts(query: Dict[str, Any]) -> Dict[str, int]:
+    counts = {}
+    async for row in jobs_collection.aggregate([{"$match": query}, {"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+    return counts
+
+def _originals_by_id(jobs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    # Children store their original's id as a string
+    return {
+        str(job.get("id") or job["_id"]): job for job in jobs
+        if job and (job.get("job_type") or JobType.ORIGINAL.value) == JobType.ORIGINAL.value
+    }
+
+async def _children_status_counts(child_filter: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    # original_job_id -> {status: count} for the children matched by child_filter
+    counts: Dict[str, Dict[str, int]] = {}
+    pipeline = [
+        {"$match": child_filter},
+        {"$group": {"_id": {"parent": "$original_job_id", "status": "$status"}, "count": {"$sum": 1}}},
+    ]
+    async for row in jobs_collection.aggregate(pipeline):
+        counts.setdefault(row["_id"]["parent"], {})[row["_id"]["status"]] = row["count"]
+    return counts
+
+async def delete_children_mongodb(parents: List[Dict[str, Any]]) -> int:
+    """
+    Deletes the copied jobs and applications of the given original jobs with one delete_many.
+    Returns the number of children deleted.
+    """
+    parents_by_id = _originals_by_id(parents)
+    if not parents_by_id:
+        return 0
+    child_filter = {"original_job_id": {"$in": list(parents_by_id)}, "job_type": {"$in": CHILD_JOB_TYPES}}
+    counts_by_parent = await _children_status_counts(child_filter)
+    if not counts_by_parent:
+        return 0
+    result = await jobs_collection.delete_many(child_filter)
+    await _record_job_writes(status_shifts=[(parents_by_id[parent_id], counts, None) for parent_id, counts in counts_by_parent.items()])
+    return result.deleted_count
+
+async def ensure_indexes_mongodb() -> None:
+    # Every hot query shape must be served by one of these; `python -m app.db.query_plans` checks it
+    await jobs_collection.create_indexes(JOB_INDEXES)
+    await users_collection.create_indexes(USER_INDEXES)
+    await invitations_collection.create_indexes(INVITATION_INDEXES)
+    await vehicles_collection.create_indexes(VEHICLE_INDEXES)
+    await idempotency_keys_collection.create_indexes(IDEMPOTENCY_KEY_INDEXES)
+
 # --- User Operations ---
 async def get_user_by_username_mongodb(username: str) -> Optional[Dict[str, Any]]:
     user = await users_collection.find_one({"username": username})
@@ -99,10 +280,10 @@ async def create_user_mongodb(user_data: UserCreate) -> Dict[str, Any]:
     new_user = await users_collection.find_one({"_id": result.inserted_id})
     return user_helper(new_user)
 
-async def get_user_by_id_mongodb(user_id: str) -> Optional[Dict[str, Any]]: # Changed user_id type to str
-    user = await users_collection.find_one({"_id": ObjectId(user_id)}) # Query by ObjectId
+async def get_user_by_id_mongodb(user_id: str, profile: str = FULL_PROFILE) -> Optional[Dict[str, Any]]: # Changed user_id type to str
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, profile_projection(USER_PROFILES, profile)) # Query by ObjectId
     if user:
-        return user_helper(user)
+        return user_helper(user, profile)
     return None
 
 async def update_user_mongodb(user_id: str, updated_data: Union[Dict[str, Any], BaseModel]) -> Optional[Dict[str, Any]]:
@@ -132,23 +313,52 @@ async def update_user_mongodb(user_id: str, updated_data: Union[Dict[str, Any],
         return user_helper(updated_user)
     return None
 
-async def get_dispatchers_by_company_id_mongodb(company_id: str) -> List[Dict[str, Any]]: # Changed company_id type to str
+async def get_users_by_usernames_mongodb(usernames: List[str]) -> Dict[str, Dict[str, Any]]:
+    # One $in query for a batch of usernames, keyed by username
+    users = {}
+    async for user in users_collection.find({"username": {"$in": usernames}}):
+        users.setdefault(user["username"], user_helper(user))
+    return users
+
+# User field and status enum of the company association for each invitable role
+ASSOCIATION_STATUS_FIELDS = {
+    RoleType.DISPATCHER.value: ("dispatcher_association_status", DispatcherAssociationStatus),
+    RoleType.DRIVER.value: ("driver_association_status", DriverAssociationStatus),
+}
+
+async def set_association_pending_mongodb(user_ids: List[str], role: RoleType) -> int:
+    """
+    Marks the association for `role` as pending on every invited user in one update_many.
+    Users already associated with a company are left alone.
+    """
+    status_field, status_enum = ASSOCIATION_STATUS_FIELDS[role.value if isinstance(role, RoleType) else role]
+    result = await users_collection.update_many(
+        {"_id": {"$in": [ObjectId(user_id) for user_id in user_ids]}, status_field: {"$ne": status_enum.ASSOCIATED.value}},
+        {"$set": {status_field: status_enum.PENDING.value}}
+    )
+    return result.modified_count
+
+async def get_dispatchers_by_company_id_mongodb(company_id: str, profile: str = FULL_PROFILE) -> List[Dict[str, Any]]: # Changed company_id type to str
     dispatchers = []
-    async for user in users_collection.find({"company_id": company_id, "roles": RoleType.DISPATCHER.value}):
-        dispatchers.append(user_helper(user))
+    async for user in users_collection.find({"company_id": company_id, "roles": RoleType.DISPATCHER.value}, profile_projection(USER_PROFILES, profile)):
+        dispatchers.append(user_helper(user, profile))
     return dispatchers
 
-async def get_drivers_by_company_id_mongodb(company_id: str) -> List[Dict[str, Any]]:
+async def get_drivers_by_company_id_mongodb(company_id: str, profile: str = FULL_PROFILE) -> List[Dict[str, Any]]:
     drivers = []
     query = {
         "company_id": company_id,
         "roles": RoleType.DRIVER.value,
         "driver_association_status": DriverAssociationStatus.ASSOCIATED.value
     }
-    async for user in users_collection.find(query):
-        drivers.append(user_helper(user))
+    async for user in users_collection.find(query, profile_projection(USER_PROFILES, profile)):
+        drivers.append(user_helper(user, profile))
     return drivers
 
+async def get_users_by_role_mongodb(role: Optional[str] = None, profile: str = FULL_PROFILE) -> List[Dict[str, Any]]:
+    query = {"roles": role} if role else {}
+    return [user_helper(user, profile) async for user in users_collection.find(query, profile_projection(USER_PROFILES, profile))]
+
 # --- Task Operations ---
 async def get_tasks_mongodb() -> List[Dict[str, Any]]:
     # Tasks are currently hardcoded in frontend, so this is a placeholder
@@ -159,7 +369,10 @@ async def create_task_mongodb(task_data: JobCreate) -> Dict[str, Any]:
     return {}
 
 # --- Job Operations ---
-async def get_jobs_mongodb(assigned_driver_id: Optional[str] = None, created_by_dispatcher_id: Optional[str] = None, is_public: Optional[bool] = None, status: Optional[str] = None, company_id: Optional[str] = None, job_type: Optional[str] = None) -> List[Dict[str, Any]]: # Added job_type
+# Documents fetched per round trip when streaming job listings
+JOBS_STREAM_BATCH_SIZE = 500
+
+def _build_jobs_query(assigned_driver_id: Optional[str] = None, created_by_dispatcher_id: Optional[str] = None, is_public: Optional[bool] = None, status: Optional[str] = None, company_id: Optional[str] = None, job_type: Optional[str] = None) -> Dict[str, Any]:
     query = {}
     if assigned_driver_id is not None:
         query["assigned_driver_id"] = assigned_driver_id
@@ -173,21 +386,53 @@ async def get_jobs_mongodb(assigned_driver_id: Optional[str] = None, created_by_
         query["company_id"] = company_id
     if job_type is not None:
         query["job_type"] = job_type
+    return query
 
+async def get_jobs_mongodb(assigned_driver_id: Optional[str] = None, created_by_dispatcher_id: Optional[str] = None, is_public: Optional[bool] = None, status: Optional[str] = None, company_id: Optional[str] = None, job_type: Optional[str] = None, max_time_ms: int = INTERACTIVE_MAX_TIME_MS, read_class: str = PRIMARY_READS) -> List[Dict[str, Any]]: # Added job_type
+    query = _build_jobs_query(assigned_driver_id, created_by_dispatcher_id, is_public, status, company_id, job_type)
     print(f"[get_jobs_mongodb] Final query: {query}")
 
     jobs = []
-    async for job in jobs_collection.find(query):
+    async for job in jobs_collection.reads(read_class).find(query).max_time_ms(max_time_ms):
         jobs.append(job_helper(job))
     print(f"[get_jobs_mongodb] Number of jobs found for query: {len(jobs)}")
     return jobs
 
+async def iter_jobs_mongodb(assigned_driver_id: Optional[str] = None, created_by_dispatcher_id: Optional[str] = None, is_public: Optional[bool] = None, status: Optional[str] = None, company_id: Optional[str] = None, job_type: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Same filters as get_jobs_mongodb, but yields jobs as the cursor decodes them
+    so callers can stream results without holding the whole list in memory.
+    """
+    query = _build_jobs_query(assigned_driver_id, created_by_dispatcher_id, is_public, status, company_id, job_type)
+    async for job in jobs_collection.reads(EXPORT_READS).find(query).batch_size(JOBS_STREAM_BATCH_SIZE).max_time_ms(EXPORT_MAX_TIME_MS):
+        yield job_helper(job)
+
+# Every job write increments the job's version for optimistic concurrency control
+VERSION_BUMP = {"$inc": {"version": 1}}
+
+def _version_filter(expected_version: Optional[int]) -> Dict[str, Any]:
+    # Jobs written before versioning have no version field and count as version 0
+    if expected_version is None:
+        return {}
+    if expected_version == 0:
+        return {"version": {"$in": [0, None]}}
+    return {"version": expected_version}
+
+def _next_version(job: Dict[str, Any]) -> int:
+    return (job.get("version") or 0) + 1
+
+def _status_stamp(set_fields: Dict[str, Any]) -> Dict[str, Any]:
+    # Records when a job entered its current status; compaction measures retention from it
+    if "status" in set_fields:
+        return {**set_fields, "status_changed_at": datetime.now(timezone.utc)}
+    return set_fields
+
 async def create_job_mongodb(job_data: JobCreate, created_by_dispatcher_id: str, company_id: Optional[str] = None, company_name: Optional[str] = None) -> Dict[str, Any]:
-    job_dict = job_data.dict()
-    job_dict["status"] = job_data.status.value
+    job_dict = _status_stamp({**job_data.dict(), "status": job_data.status.value})
     job_dict["created_by_dispatcher_id"] = created_by_dispatcher_id
     job_dict["company_id"] = company_id
     job_dict["company_name"] = company_name
+    job_dict["version"] = 1
 
     # Set job_type if not already set (e.g., for original jobs)
     if "job_type" not in job_dict or job_dict["job_type"] is None:
@@ -200,15 +445,17 @@ async def create_job_mongodb(job_data: JobCreate, created_by_dispatcher_id: str,
 
     result = await jobs_collection.insert_one(job_dict)
     new_job = await jobs_collection.find_one({"_id": result.inserted_id})
+    await _record_job_writes(changes=[(None, new_job)])
     return job_helper(new_job)
 
-async def create_job_application_mongodb(original_job: Dict[str, Any], driver_id: str, vehicle_id: str, driver_name: str, driver_phone: str) -> Optional[Dict[str, Any]]:
+async def create_job_application_mongodb(original_job: Dict[str, Any], driver_id: str, vehicle_id: str, driver_name: str, driver_phone: str, selected_vehicle: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
     # Generate a unique copied_job_id based on original_job_id and a timestamp
     timestamp = int(time.time() * 1000) # Milliseconds since epoch
     application_id = f"{original_job['id']}-APP-{driver_id}-{timestamp}"
 
-    # Fetch vehicle details
-    selected_vehicle = await get_vehicle_by_id_mongodb(vehicle_id)
+    # Fetch vehicle details unless the caller already loaded them
+    if selected_vehicle is None:
+        selected_vehicle = await get_vehicle_by_id_mongodb(vehicle_id)
     if not selected_vehicle:
         print(f"[create_job_application_mongodb] Vehicle with ID {vehicle_id} not found.")
         return None # Or raise an error
@@ -241,13 +488,14 @@ async def create_job_application_mongodb(original_job: Dict[str, Any], driver_id
                                      company_id=original_job.get("company_id"),
                                      company_name=original_job.get("company_name"))
 
-async def create_copied_job_mongodb(original_job: Dict[str, Any], driver_id: str, vehicle_id: str, driver_name: str, driver_phone: str) -> Optional[Dict[str, Any]]:
+async def create_copied_job_mongodb(original_job: Dict[str, Any], driver_id: str, vehicle_id: str, driver_name: str, driver_phone: str, selected_vehicle: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
     # Generate a unique copied_job_id based on original_job_id and a timestamp
     timestamp = int(time.time() * 1000) # Milliseconds since epoch
     copied_job_id = f"{original_job['id']}-COPY-{timestamp}"
 
-    # Fetch vehicle details to get license plate and model
-    selected_vehicle = await get_vehicle_by_id_mongodb(vehicle_id)
+    # Fetch vehicle details to get license plate and model, unless the caller already loaded them
+    if selected_vehicle is None:
+        selected_vehicle = await get_vehicle_by_id_mongodb(vehicle_id)
     if not selected_vehicle:
         print(f"[create_copied_job_mongodb] Vehicle with ID {vehicle_id} not found.")
         return None # Or raise an error
@@ -281,9 +529,14 @@ async def create_copied_job_mongodb(original_job: Dict[str, Any], driver_id: str
                                      company_id=original_job.get("company_id"),
                                      company_name=original_job.get("company_name"))
 
-async def accept_copied_job_mongodb(copied_job_id: str, driver_id: str) -> Optional[Dict[str, Any]]:
-    # 1. Find the copied job and its original job ID
-    copied_job = await jobs_collection.find_one({"copied_job_id": copied_job_id, "job_type": {"$in": [JobType.COPIED.value, JobType.APPLICATION.value]}})
+async def accept_copied_job_mongodb(copied_job_id: str, driver_id: str, copied_job_item: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    # 1. Find the copied job and its original job ID, unless the caller already loaded it
+    if copied_job_item is not None and copied_job_item.get("job_type") in [JobType.COPIED.value, JobType.APPLICATION.value]:
+        copied_job = copied_job_item
+        copied_job_ids = _job_id_candidates([copied_job_item["id"]])
+    else:
+        copied_job = await jobs_collection.find_one({"copied_job_id": copied_job_id, "job_type": {"$in": [JobType.COPIED.value, JobType.APPLICATION.value]}})
+        copied_job_ids = [copied_job["_id"]] if copied_job else []
     if not copied_job:
         print(f"[accept_copied_job_mongodb] Copied job with ID {copied_job_id} not found or invalid type.")
         return None
@@ -313,7 +566,9 @@ async def accept_copied_job_mongodb(copied_job_id: str, driver_id: str) -> Optio
                 "vehicle_model": copied_job.get("vehicle_model"), # Copy vehicle make
                 "vehicle_number": copied_job.get("vehicle_number"),
                 "vehicle_type": copied_job.get("vehicle_type"),
-            }
+                "status_changed_at": datetime.now(timezone.utc),
+            },
+            **VERSION_BUMP
         },
         return_document=True # Return the updated document
     )
@@ -324,46 +579,58 @@ async def accept_copied_job_mongodb(copied_job_id: str, driver_id: str) -> Optio
 
     # 3. Update the accepted copied job's status
     await jobs_collection.update_one(
-        {"_id": copied_job["_id"]},
-        {"$set": {"status": JobStatus.ACCEPTED.value, "driver_response_status": "accepted"}}
+        {"_id": {"$in": copied_job_ids}},
+        {"$set": _status_stamp({"status": JobStatus.ACCEPTED.value, "driver_response_status": "accepted"}), **VERSION_BUMP}
     )
 
     # 4. Supersede all other copied jobs related to this original_job_id
     # This includes other COPIED jobs and APPLICATION jobs
+    sibling_filter = {
+        "original_job_id": original_job_id,
+        "job_type": {"$in": [JobType.COPIED.value, JobType.APPLICATION.value]},
+        "_id": {"$nin": copied_job_ids}, # Exclude the currently accepted copied job
+        "status": {"$ne": JobStatus.SUPERSEDED.value},
+    }
+    sibling_counts = await _status_counts(sibling_filter)
     await jobs_collection.update_many(
-        filter={
-            "original_job_id": original_job_id,
-            "job_type": {"$in": [JobType.COPIED.value, JobType.APPLICATION.value]},
-            "_id": {"$ne": copied_job["_id"]} # Exclude the currently accepted copied job
-        },
-        update={"$set": {"status": JobStatus.SUPERSEDED.value, "driver_response_status": "superseded"}}
+        filter=sibling_filter,
+        update={"$set": _status_stamp({"status": JobStatus.SUPERSEDED.value, "driver_response_status": "superseded"}), **VERSION_BUMP}
     )
 
+    await _record_job_writes(
+        changes=[
+            ({**updated_original_job, "status": JobStatus.PENDING.value}, updated_original_job),
+            (copied_job, {**copied_job, "status": JobStatus.ACCEPTED.value}),
+        ],
+        status_shifts=[(copied_job, sibling_counts, JobStatus.SUPERSEDED.value)],
+    )
     return job_helper(updated_original_job)
 
 async def reject_copied_job_mongodb(copied_job_id: str) -> bool:
     # Find the job to be rejected and delete it
-    result = await jobs_collection.delete_one(
+    deleted_job = await jobs_collection.find_one_and_delete(
         {
             "copied_job_id": copied_job_id,
             "job_type": {"$in": [JobType.COPIED.value, JobType.APPLICATION.value]},
             "status": {"$in": [JobStatus.PENDING_ACCEPTANCE.value, JobStatus.APPLICATION_REQUESTED.value]}
         }
     )
-    return result.deleted_count > 0
+    await _record_job_writes(changes=[(deleted_job, None)])
+    return deleted_job is not None
 
 async def delete_driver_application_mongodb(copied_job_id: str, driver_id: str) -> bool:
     """
     Deletes a driver's own job application if it is in a terminal state (superseded, rejected, or accepted).
     """
-    result = await jobs_collection.delete_one(
+    deleted_job = await jobs_collection.find_one_and_delete(
         {
             "copied_job_id": copied_job_id,
             "assigned_driver_id": driver_id, # Security: ensures drivers can only delete their own jobs
             "status": {"$in": [JobStatus.SUPERSEDED.value, JobStatus.REJECTED.value, JobStatus.ACCEPTED.value]}
         }
     )
-    return result.deleted_count > 0
+    await _record_job_writes(changes=[(deleted_job, None)])
+    return deleted_job is not None
 
 async def get_job_by_id_mongodb(job_id: str) -> Optional[Dict[str, Any]]: # Changed job_id type to str
     # Try to query by ObjectId first, then by string if not found
@@ -374,17 +641,84 @@ async def get_job_by_id_mongodb(job_id: str) -> Optional[Dict[str, Any]]: # Chan
         return job_helper(job)
     return None
 
+def _job_id_candidates(job_ids: List[str]) -> List[Any]:
+    # Job _ids may be stored as strings or ObjectIds, so match both forms
+    candidates = []
+    for job_id in job_ids:
+        candidates.append(job_id)
+        if ObjectId.is_valid(job_id):
+            candidates.append(ObjectId(job_id))
+    return candidates
+
+async def get_jobs_by_ids_mongodb(job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads the fields needed to authorize and account for batch operations
+    on many jobs in one query, keyed by job id.
+    """
+    projection = {"status": 1, "job_type": 1, "is_public": 1, "company_id": 1, "created_by_dispatcher_id": 1}
+    jobs = {}
+    async for job in jobs_collection.find({"_id": {"$in": _job_id_candidates(job_ids)}}, projection):
+        job_item = job_helper(job)
+        jobs[job_item["id"]] = job_item
+    return jobs
+
+async def delete_jobs_mongodb(jobs: List[Dict[str, Any]]) -> List[str]:
+    """
+    Deletes jobs concurrently, one delete_one each, so that only the jobs this call
+    removed are counted and returned; a job deleted at the same time elsewhere is skipped.
+    """
+    if not jobs:
+        return []
+    results = await asyncio.gather(*(jobs_collection.delete_one({"_id": {"$in": _job_id_candidates([job["id"]])}}) for job in jobs))
+    deleted = [job for job, result in zip(jobs, results) if result.deleted_count]
+    await _record_job_writes(changes=[(job, None) for job in deleted])
+    await delete_children_mongodb(deleted)
+    return [job["id"] for job in deleted]
+
+async def update_jobs_mongodb(jobs: List[Dict[str, Any]], updated_data: Dict[str, Any], precondition: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Applies the same $set to every job in one update_many. `precondition` is added
+    to the filter so jobs that changed since they were authorized are skipped.
+    Returns the ids of the jobs this call updated.
+    """
+    if not jobs:
+        return []
+    set_fields = {key: value.value if isinstance(value, (JobStatus, JobType)) else value for key, value in updated_data.items()}
+    id_filter = {"_id": {"$in": _job_id_candidates([job["id"] for job in jobs])}}
+    eligible = jobs
+    if precondition:
+        # Jobs that pass the precondition are the ones this call will update
+        eligible_ids = {str(job["_id"]) async for job in jobs_collection.find({**id_filter, **precondition}, {"_id": 1})}
+        eligible = [job for job in jobs if job["id"] in eligible_ids]
+        if not eligible:
+            return []
+        id_filter = {"_id": {"$in": _job_id_candidates([job["id"] for job in eligible])}}
+    result = await jobs_collection.update_many({**id_filter, **(precondition or {})}, {"$set": _status_stamp(set_fields), **VERSION_BUMP})
+
+    if result.modified_count == len(eligible):
+        await _record_job_writes(changes=[(job, {**job, **set_fields}) for job in eligible])
+        return [job["id"] for job in eligible]
+    # A job changed between the read and the update, so which ones this call wrote is ambiguous
+    updated_ids = {str(job["_id"]) async for job in jobs_collection.find({**id_filter, **set_fields}, {"_id": 1})}
+    applied = [job for job in eligible if job["id"] in updated_ids]
+    print(f"[update_jobs_mongodb] {len(eligible) - result.modified_count} jobs changed during a batch update; counters will be reconciled")
+    return [job["id"] for job in applied]
+
 async def get_job_by_copied_job_id_mongodb(copied_job_id: str) -> Optional[Dict[str, Any]]:
     job = await jobs_collection.find_one({"copied_job_id": copied_job_id})
     if job:
         return job_helper(job)
     return None
 
-async def update_job_mongodb(job_id: str, updated_data: Union[Dict[str, Any], BaseModel]) -> Optional[Dict[str, Any]]: # Changed job_id type to str
+async def update_job_mongodb(job_id: str, updated_data: Union[Dict[str, Any], BaseModel], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]: # Changed job_id type to str
+    """
+    Returns None when the job does not exist or, if `expected_version` is given,
+    when the job's version no longer matches it.
+    """
     if isinstance(updated_data, BaseModel):
         updated_data = updated_data.dict(exclude_unset=True)
 
-    update_query = {"$set": {}}
+    update_query = {"$set": {}, **VERSION_BUMP}
     for key, value in updated_data.items():
         if key == "status":
             update_query["$set"]["status"] = value.value if isinstance(value, JobStatus) else value
@@ -392,41 +726,214 @@ async def update_job_mongodb(job_id: str, updated_data: Union[Dict[str, Any], Ba
             update_query["$set"]["job_type"] = value.value if isinstance(value, JobType) else value
         else:
             update_query["$set"][key] = value
+    update_query["$set"] = _status_stamp(update_query["$set"])
 
-    # Try to update by ObjectId first, then by string if not found
-    result = await jobs_collection.update_one({"_id": job_id}, update_query)
-    if result.matched_count == 0 and ObjectId.is_valid(job_id):
-        result = await jobs_collection.update_one({"_id": ObjectId(job_id)}, update_query)
-
-    if result.modified_count > 0:
-        updated_job = await jobs_collection.find_one({"_id": job_id})
-        if not updated_job and ObjectId.is_valid(job_id):
-            updated_job = await jobs_collection.find_one({"_id": ObjectId(job_id)})
-        return job_helper(updated_job)
-    return None
+    # The pre-image tells the counters which status the job is leaving.
+    job_filter = {"_id": {"$in": _job_id_candidates([job_id])}, **_version_filter(expected_version)}
+    previous_job = await jobs_collection.find_one_and_update(job_filter, update_query, return_document=ReturnDocument.BEFORE)
+    if not previous_job:
+        return None
+    updated_job = {**previous_job, **update_query["$set"], "version": _next_version(previous_job)}
+    await _record_job_writes(changes=[(previous_job, updated_job)])
+    return job_helper(updated_job)
 
 async def delete_job_mongodb(job_id: str) -> bool:
-    result = await jobs_collection.delete_one({"_id": job_id})
-    if result.deleted_count == 0 and ObjectId.is_valid(job_id):
-        result = await jobs_collection.delete_one({"_id": ObjectId(job_id)})
-    return result.deleted_count > 0
-
-async def replace_job_mongodb(job_id: str, replacement_data: dict) -> Optional[Dict[str, Any]]:
+    deleted_job = await jobs_collection.find_one_and_delete({"_id": job_id})
+    if not deleted_job and ObjectId.is_valid(job_id):
+        deleted_job = await jobs_collection.find_one_and_delete({"_id": ObjectId(job_id)})
+    await _record_job_writes(changes=[(deleted_job, None)])
+    if deleted_job:
+        await delete_children_mongodb([deleted_job])
+    return deleted_job is not None
+
+async def replace_job_mongodb(job_id: str, replacement_data: dict, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
     # The replacement document cannot contain the _id field. Let's be safe.
     replacement_data.pop('_id', None)
-    result = await jobs_collection.replace_one({"_id": job_id}, replacement_data)
-    if result.matched_count == 0 and ObjectId.is_valid(job_id):
-        result = await jobs_collection.replace_one({"_id": ObjectId(job_id)}, replacement_data)
-
-    if result.matched_count > 0:
+    replacement_data.pop('version', None)
+    # A pipeline update replaces the document and bumps its version in the same round trip.
+    # $literal keeps values starting with "$" from being read as field paths.
+    replace_pipeline = [{"$replaceWith": {"$mergeObjects": [
+        {"$literal": replacement_data},
+        {"_id": "$_id", "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}},
+    ]}}]
+    job_filter = {"_id": {"$in": _job_id_candidates([job_id])}, **_version_filter(expected_version)}
+    previous_job = await jobs_collection.find_one_and_update(job_filter, replace_pipeline, return_document=ReturnDocument.BEFORE)
+
+    if previous_job:
         # If we found a document, the replacement was successful.
-        replaced_job = await jobs_collection.find_one({"_id": job_id})
-        if not replaced_job and ObjectId.is_valid(job_id):
-            replaced_job = await jobs_collection.find_one({"_id": ObjectId(job_id)})
+        replaced_job = {"_id": previous_job["_id"], **replacement_data, "version": _next_version(previous_job)}
+        await _record_job_writes(changes=[(previous_job, replaced_job)])
         return job_helper(replaced_job)
-    # If no document was matched, it means the original_job_id was not found.
+    # No document matched: the job was not found or its version changed.
     return None
 
+async def get_job_lineage_mongodb(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Loads an original job together with its copied jobs and applications in one
+    aggregation; the $lookup is served by the lineage index.
+    """
+    pipeline = [
+        {"$match": {"_id": {"$in": _job_id_candidates([job_id])}}},
+        {"$limit": 1},
+        {"$addFields": {"lineage_id": {"$toString": "$_id"}}},
+        {"$lookup": {"from": jobs_collection.name, "localField": "lineage_id", "foreignField": "original_job_id", "as": "children"}},
+    ]
+    async for job in jobs_collection.aggregate(pipeline):
+        children = [job_helper(child) for child in job.pop("children") if child.get("job_type") in CHILD_JOB_TYPES]
+        status_counts: Dict[str, int] = {}
+        for child in children:
+            status_counts[child["status"]] = status_counts.get(child["status"], 0) + 1
+        return {"job": job_helper(job), "children": children, "status_counts": status_counts}
+    return None
+
+async def get_company_job_analytics_mongodb(company_id: str, archive_collections: Optional[List[str]] = None) -> Dict[str, Any]:
+    # total_price is stored as free text, so unparsable prices count as 0
+    price = {"$convert": {"input": "$total_price", "to": "double", "onError": 0, "onNull": 0}}
+    revenue_jobs = {"$match": {"status": {"$in": REVENUE_STATUSES}}}
+    company_jobs = {"$match": {"company_id": company_id, "job_type": JobType.ORIGINAL.value}}
+    pipeline = [
+        company_jobs,
+        # Archived jobs (see app/db/job_archive.py) join the same aggregation when asked for
+        *[{"$unionWith": {"coll": name, "pipeline": [company_jobs]}} for name in archive_collections or []],
+        {"$facet": {
+            "by_status": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+            ],
+            "by_day": [
+                {"$group": {"_id": "$pick_up_date", "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+            "by_dispatcher": [
+                revenue_jobs,
+                {"$group": {"_id": "$created_by_dispatcher_id", "job_count": {"$sum": 1}, "revenue": {"$sum": price}}},
+                {"$sort": {"revenue": -1}},
+            ],
+            "by_driver": [
+                revenue_jobs,
+                {"$match": {"assigned_driver_id": {"$ne": None}}},
+                {"$group": {"_id": "$assigned_driver_id", "name": {"$first": "$driver_name"}, "job_count": {"$sum": 1}, "revenue": {"$sum": price}}},
+                {"$sort": {"revenue": -1}},
+            ],
+        }},
+    ]
+    max_time_ms = EXPORT_MAX_TIME_MS if archive_collections else INTERACTIVE_MAX_TIME_MS
+    results = await jobs_collection.reads(ANALYTICS_READS).aggregate(pipeline, maxTimeMS=max_time_ms).to_list(length=1)
+    facets = results[0] if results else {}
+
+    status_counts = {row["_id"]: row["count"] for row in facets.get("by_status", [])}
+    return {
+        "company_id": company_id,
+        "total_jobs": sum(status_counts.values()),
+        "status_counts": status_counts,
+        "jobs_per_day": [{"date": row["_id"], "count": row["count"]} for row in facets.get("by_day", [])],
+        "revenue_by_dispatcher": [
+            {"id": row["_id"], "job_count": row["job_count"], "revenue": row["revenue"]}
+            for row in facets.get("by_dispatcher", [])
+        ],
+        "revenue_by_driver": [
+            {"id": row["_id"], "name": row.get("name"), "job_count": row["job_count"], "revenue": row["revenue"]}
+            for row in facets.get("by_driver", [])
+        ],
+    }
+
+# --- Company Roster ---
+async def get_company_roster_mongodb(company_id: str) -> Dict[str, Any]:
+    """
+    Dispatchers, associated drivers with their vehicles, and pending invitations of a
+    company in one aggregation, with users in the picker profile. The company's own
+    document joins the input so the invitations facet has a document to $lookup from
+    even when the roster is empty.
+    """
+    pipeline = [
+        {"$match": {"$or": [{"company_id": company_id}, {"_id": ObjectId(company_id)}]}},
+        {"$facet": {
+            # Same members as get_dispatchers_by_company_id_mongodb / get_drivers_by_company_id_mongodb
+            "dispatchers": [
+                {"$match": {"company_id": company_id, "roles": RoleType.DISPATCHER.value}},
+                {"$project": profile_projection(USER_PROFILES, "picker")},
+                {"$sort": {"username": 1}},
+            ],
+            "drivers": [
+                {"$match": {"company_id": company_id, "roles": RoleType.DRIVER.value, "driver_association_status": DriverAssociationStatus.ASSOCIATED.value}},
+                {"$project": {**profile_projection(USER_PROFILES, "picker"), "owner_id": {"$toString": "$_id"}}},
+                {"$lookup": {"from": vehicles_collection.name, "localField": "owner_id", "foreignField": "owner_id", "as": "vehicles"}},
+                {"$sort": {"username": 1}},
+            ],
+            "pending_invitations": [
+                {"$match": {"_id": ObjectId(company_id)}},
+                {"$lookup": {
+                    "from": invitations_collection.name,
+                    "pipeline": [{"$match": {"company_id": company_id, "status": InvitationStatus.PENDING.value}}, {"$sort": {"_id": 1}}],
+                    "as": "invitations",
+                }},
+                {"$unwind": "$invitations"},
+                {"$replaceRoot": {"newRoot": "$invitations"}},
+            ],
+        }},
+    ]
+    results = await users_collection.aggregate(pipeline, maxTimeMS=INTERACTIVE_MAX_TIME_MS).to_list(length=1)
+    facets = results[0] if results else {}
+
+    dispatchers = [user_helper(row, "picker") for row in facets.get("dispatchers", [])]
+    drivers = [
+        {**user_helper(row, "picker"), "vehicles": [vehicle_helper(vehicle) for vehicle in row.get("vehicles", [])]}
+        for row in facets.get("drivers", [])
+    ]
+    pending_invitations = [invitation_helper(row) for row in facets.get("pending_invitations", [])]
+    return {
+        "company_id": company_id,
+        "dispatchers": dispatchers,
+        "drivers": drivers,
+        "pending_invitations": pending_invitations,
+        "counts": {
+            "dispatchers": len(dispatchers),
+            "drivers": len(drivers),
+            "vehicles": sum(len(driver["vehicles"]) for driver in drivers),
+            "pending_invitations": len(pending_invitations),
+        },
+    }
+
+# --- Job Counter Operations ---
+async def get_job_counters_mongodb(scope: str, scope_id: str) -> Dict[str, int]:
+    counters = await counters_collection.find_one({"_id": f"{scope}:{scope_id}"})
+    if not counters:
+        return {}
+    # Zeroed statuses are left behind by $inc; drop them from the response
+    return {job_status: count for job_status, count in counters.get("statuses", {}).items() if count}
+
+async def rebuild_job_counters_mongodb() -> int:
+    """
+    Recomputes every counters document from the jobs collection and
+    returns the number of counters documents written.
+    """
+    pipeline = [
+        {"$facet": {
+            "company": [
+                {"$match": {"company_id": {"$ne": None}}},
+                {"$group": {"_id": {"scope_id": "$company_id", "status": "$status"}, "count": {"$sum": 1}}},
+            ],
+            "dispatcher": [
+                {"$match": {"created_by_dispatcher_id": {"$ne": None}}},
+                {"$group": {"_id": {"scope_id": "$created_by_dispatcher_id", "status": "$status"}, "count": {"$sum": 1}}},
+            ],
+        }},
+    ]
+    counters: Dict[str, Dict[str, int]] = {}
+    async for facets in jobs_collection.aggregate(pipeline):
+        for scope, rows in facets.items():
+            for row in rows:
+                key = f"{scope}:{row['_id']['scope_id']}"
+                counters.setdefault(key, {})[row["_id"]["status"]] = row["count"]
+
+    if counters:
+        await counters_collection.bulk_write(
+            [ReplaceOne({"_id": key}, {"statuses": statuses}, upsert=True) for key, statuses in counters.items()],
+            ordered=False
+        )
+    # Remove counters for companies/dispatchers that no longer have any jobs
+    await counters_collection.delete_many({"_id": {"$nin": list(counters.keys())}})
+    return len(counters)
+
 
 # --- Invitation Operations ---
 async def get_invitation_by_id_mongodb(invitation_id: str) -> Optional[Dict[str, Any]]: # Changed invitation_id type to str
@@ -455,6 +962,25 @@ async def create_invitation_mongodb(
     new_invitation = await invitations_collection.find_one({"_id": result.inserted_id})
     return invitation_helper(new_invitation)
 
+async def create_invitations_mongodb(
+    invitees: List[Dict[str, Any]],
+    invitee_role: RoleType,
+    company_id: str,
+    company_name: str
+) -> List[Dict[str, Any]]:
+    # One insert_many for a batch of invitees; insert_many fills in each document's _id, so nothing is read back
+    invitation_dicts = [{
+        "company_id": company_id,
+        "company_name": company_name,
+        "invitee_id": invitee["id"],
+        "invitee_username": invitee["username"],
+        "invitee_role": invitee_role.value if isinstance(invitee_role, RoleType) else invitee_role,
+        "status": InvitationStatus.PENDING.value,
+    } for invitee in invitees]
+    if invitation_dicts:
+        await invitations_collection.insert_many(invitation_dicts)
+    return [invitation_helper(invitation) for invitation in invitation_dicts]
+
 async def update_invitation_mongodb(invitation_id: str, updated_data: Dict[str, Any]) -> Optional[Dict[str, Any]]: # Changed invitation_id type to str
     update_query = {"$set": {}}
     for key, value in updated_data.items():
@@ -469,6 +995,70 @@ async def update_invitation_mongodb(invitation_id: str, updated_data: Dict[str,
         return invitation_helper(updated_invitation)
     return None
 
+class InvitationResponseError(Exception):
+    def __init__(self, reason: str, detail: str):
+        super().__init__(detail)
+        self.reason = reason # "not_found", "forbidden" or "not_pending"
+        self.detail = detail
+
+async def _invitation_response_error(invitation_id: str, invitee_id: str, invitee_role: str) -> InvitationResponseError:
+    # Only read when the conditional update matched nothing, to say why
+    invitation = await invitations_collection.find_one({"_id": ObjectId(invitation_id)})
+    if not invitation:
+        return InvitationResponseError("not_found", "Invitation not found")
+    if invitation["invitee_id"] != invitee_id or invitation["invitee_role"] != invitee_role:
+        return InvitationResponseError("forbidden", f"Not authorized to respond to this invitation or invitation is not for a {invitee_role}")
+    return InvitationResponseError("not_pending", "Invitation is not pending")
+
+async def respond_to_invitation_mongodb(invitation_id: str, invitee_id: str, invitee_role: RoleType, accept: bool) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Accepts or declines a pending invitation and updates the invitee in one transaction.
+    The invitation moves out of PENDING with a conditional find_one_and_update, so only one
+    of two concurrent responses wins. Accepting associates the invitee with the company and
+    declines their other pending invitations for the same role.
+    Returns the updated invitation and invitee; raises InvitationResponseError.
+    """
+    role = invitee_role.value if isinstance(invitee_role, RoleType) else invitee_role
+    status_field, status_enum = ASSOCIATION_STATUS_FIELDS[role]
+    pending = {"invitee_id": invitee_id, "invitee_role": role, "status": InvitationStatus.PENDING.value}
+    new_status = InvitationStatus.ACCEPTED.value if accept else InvitationStatus.DECLINED.value
+
+    async def respond(session):
+        invitation = await invitations_collection.find_one_and_update(
+            {"_id": ObjectId(invitation_id), **pending},
+            {"$set": {"status": new_status}},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if not invitation:
+            return None, None
+        if accept:
+            invitee = await users_collection.find_one_and_update(
+                {"_id": ObjectId(invitee_id)},
+                {"$set": {"company_id": invitation["company_id"], "company_name": invitation["company_name"], status_field: status_enum.ASSOCIATED.value}},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            await invitations_collection.update_many(
+                {**pending, "_id": {"$ne": invitation["_id"]}},
+                {"$set": {"status": InvitationStatus.DECLINED.value}},
+                session=session
+            )
+        else:
+            # A pending association goes back to unassociated; an existing one is kept
+            invitee = await users_collection.find_one_and_update(
+                {"_id": ObjectId(invitee_id), status_field: status_enum.PENDING.value},
+                {"$set": {status_field: status_enum.UNASSOCIATED.value}},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+        return invitation_helper(invitation), user_helper(invitee) if invitee else None
+
+    invitation, invitee = await run_transaction(respond)
+    if invitation is None:
+        raise await _invitation_response_error(invitation_id, invitee_id, role)
+    return invitation, invitee
+
 async def get_invitations_for_invitee_mongodb(invitee_id: str, invitee_role: RoleType) -> List[Dict[str, Any]]:
     invitations = []
     async for inv in invitations_collection.find({
@@ -481,7 +1071,9 @@ async def get_invitations_for_invitee_mongodb(invitee_id: str, invitee_role: Rol
 
 
 # --- Vehicle Operations ---
-def vehicle_helper(vehicle) -> Dict[str, Any]:
+def vehicle_helper(vehicle, profile: str = FULL_PROFILE) -> Dict[str, Any]:
+    if profile != FULL_PROFILE:
+        return _profiled(vehicle, VEHICLE_PROFILES[profile])
     return {
         "id": str(vehicle["_id"]),
         "license_plate": vehicle["license_plate"],
@@ -495,21 +1087,21 @@ def vehicle_helper(vehicle) -> Dict[str, Any]:
         "owner_id": vehicle.get("owner_id"),
     }
 
-async def get_vehicles_mongodb(owner_id: Optional[str] = None) -> List[Dict[str, Any]]:
+async def get_vehicles_mongodb(owner_id: Optional[str] = None, profile: str = FULL_PROFILE) -> List[Dict[str, Any]]:
     query = {}
     if owner_id:
         query["owner_id"] = owner_id
 
 
     vehicles = []
-    async for vehicle in vehicles_collection.find(query):
-        vehicles.append(vehicle_helper(vehicle))
+    async for vehicle in vehicles_collection.find(query, profile_projection(VEHICLE_PROFILES, profile)):
+        vehicles.append(vehicle_helper(vehicle, profile))
     return vehicles
 
-async def get_vehicle_by_id_mongodb(vehicle_id: str) -> Optional[Dict[str, Any]]:
-    vehicle = await vehicles_collection.find_one({"_id": ObjectId(vehicle_id)})
+async def get_vehicle_by_id_mongodb(vehicle_id: str, profile: str = FULL_PROFILE) -> Optional[Dict[str, Any]]:
+    vehicle = await vehicles_collection.find_one({"_id": ObjectId(vehicle_id)}, profile_projection(VEHICLE_PROFILES, profile))
     if vehicle:
-        return vehicle_helper(vehicle)
+        return vehicle_helper(vehicle, profile)
     return None
 
 async def create_vehicle_mongodb(vehicle_data: VehicleCreate) -> Dict[str, Any]:
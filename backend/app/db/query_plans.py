@@ -0,0 +1,238 @@
+"""
+Query-plan regression check for the hot query shapes in app/db/mongodb.py.
+
+    MONGO_DETAILS=mongodb://localhost:27017 python -m app.db.query_plans [--database NAME] [--keep]
+
+Seeds a scratch database on a local mongod with synthetic users, jobs, invitations and
+vehicles, creates the indexes from ensure_indexes_mongodb, and runs explain() on every
+shape below. A shape fails when its winning plan scans the collection or examines more
+than EXAMINED_RATIO times the documents it matches, so a new filter without a supporting
+index fails CI instead of production. Exits with status 1 on any failure.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app.api.v1.schemas.jobs import JobStatus, JobType
+from app.api.v1.schemas.users import RoleType, DriverAssociationStatus
+from app.api.v1.schemas.invitations import InvitationStatus
+from app.core import mongodb_config
+
+# A plan may examine this many documents per matching document (plus EXAMINED_SLACK) before it fails
+EXAMINED_RATIO = 2.0
+EXAMINED_SLACK = 10
+INDEX_STAGES = {"IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "EXPRESS_CLUSTERED_IXSCAN", "COUNT_SCAN", "DISTINCT_SCAN"}
+
+COMPANIES = 5
+DISPATCHERS_PER_COMPANY = 4
+DRIVERS_PER_COMPANY = 20
+ORIGINAL_JOBS = 4000
+INVITATIONS = 600
+CHILD_TYPES = [JobType.COPIED.value, JobType.APPLICATION.value]
+
+class QueryShape:
+    def __init__(self, name: str, collection: str, filter: Dict[str, Any], kind: str = "find"):
+        self.name = name
+        self.collection = collection
+        self.filter = filter
+        self.kind = kind # find, aggregate, update, delete or findAndModify, as issued by the code
+
+    def explain_command(self) -> Dict[str, Any]:
+        # Explained write commands are planned but never executed
+        touch = {"$set": {"query_plan_check": True}}
+        if self.kind == "aggregate":
+            command = {"aggregate": self.collection, "pipeline": [{"$match": self.filter}, {"$group": {"_id": "$status", "count": {"$sum": 1}}}], "cursor": {}}
+        elif self.kind == "update":
+            command = {"update": self.collection, "updates": [{"q": self.filter, "u": touch, "multi": True}]}
+        elif self.kind == "delete":
+            command = {"delete": self.collection, "deletes": [{"q": self.filter, "limit": 0}]}
+        elif self.kind == "findAndModify":
+            command = {"findAndModify": self.collection, "query": self.filter, "update": touch}
+        else:
+            command = {"find": self.collection, "filter": self.filter}
+        return {"explain": command, "verbosity": "executionStats"}
+
+def _seed_documents(rng: random.Random, now: datetime) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Any]]:
+    users, jobs, invitations, vehicles = [], [], [], []
+    companies = []
+    for c in range(COMPANIES):
+        company = {"_id": ObjectId(), "username": f"company{c}", "roles": [RoleType.COMPANY.value]}
+        company_id = str(company["_id"])
+        dispatchers = [{"_id": ObjectId(), "username": f"dispatcher{c}_{d}", "roles": [RoleType.DISPATCHER.value], "company_id": company_id} for d in range(DISPATCHERS_PER_COMPANY)]
+        drivers = [{
+            "_id": ObjectId(), "username": f"driver{c}_{d}", "roles": [RoleType.DRIVER.value], "company_id": company_id,
+            "driver_association_status": DriverAssociationStatus.ASSOCIATED.value if d % 10 else DriverAssociationStatus.UNASSOCIATED.value,
+        } for d in range(DRIVERS_PER_COMPANY)]
+        users += [company, *dispatchers, *drivers]
+        companies.append((company_id, [str(u["_id"]) for u in dispatchers], [str(u["_id"]) for u in drivers]))
+        for driver in drivers:
+            vehicles += [{"owner_id": str(driver["_id"]), "license_plate": f"{driver['username']}-{v}"} for v in range(2)]
+
+    original_statuses = [JobStatus.PENDING.value, JobStatus.ASSIGNED.value, JobStatus.COMPLETED.value, JobStatus.CANCELLED.value, JobStatus.CLAIM_REQUESTED.value]
+    child_statuses = [JobStatus.PENDING_ACCEPTANCE.value, JobStatus.APPLICATION_REQUESTED.value, JobStatus.ACCEPTED.value, JobStatus.REJECTED.value, JobStatus.SUPERSEDED.value]
+    for _ in range(ORIGINAL_JOBS):
+        company_id, dispatcher_ids, driver_ids = rng.choice(companies)
+        status = rng.choice(original_statuses)
+        original = {
+            "_id": ObjectId.from_datetime(now - timedelta(days=rng.uniform(0, 365))),
+            "job_type": JobType.ORIGINAL.value, "status": status, "company_id": company_id,
+            "created_by_dispatcher_id": rng.choice(dispatcher_ids),
+            "is_public": status == JobStatus.PENDING.value and rng.random() < 0.5,
+            "assigned_driver_id": rng.choice(driver_ids) if status in (JobStatus.ASSIGNED.value, JobStatus.COMPLETED.value) else None,
+            "status_changed_at": now - timedelta(days=rng.uniform(0, 365)), "version": 1,
+        }
+        jobs.append(original)
+        for _ in range(rng.choice([0, 0, 1, 2, 3])):
+            jobs.append({
+                "_id": ObjectId(), "job_type": rng.choice(CHILD_TYPES), "status": rng.choice(child_statuses),
+                "company_id": company_id, "created_by_dispatcher_id": original["created_by_dispatcher_id"],
+                "original_job_id": str(original["_id"]), "copied_job_id": str(uuid.uuid4()),
+                "assigned_driver_id": rng.choice(driver_ids), "is_public": False,
+                "status_changed_at": now - timedelta(days=rng.uniform(0, 60)), "version": 1,
+            })
+
+    for _ in range(INVITATIONS):
+        company_id, _, driver_ids = rng.choice(companies)
+        invitations.append({
+            "company_id": company_id, "invitee_id": rng.choice(driver_ids), "invitee_role": RoleType.DRIVER.value,
+            "status": rng.choice([status.value for status in InvitationStatus]),
+        })
+
+    child = next(job for job in jobs if job["job_type"] != JobType.ORIGINAL.value)
+    company_id, dispatcher_ids, driver_ids = companies[0]
+    sample = {
+        "company_id": company_id, "dispatcher_id": dispatcher_ids[0], "driver_id": driver_ids[1],
+        "username": users[1]["username"], "child": child, "job_ids": [str(job["_id"]) for job in jobs[:20]],
+    }
+    return {"users_collection": users, "jobs_collection": jobs, "invitations_collection": invitations, "vehicles_collection": vehicles}, sample
+
+def query_shapes(sample: Dict[str, Any], now: datetime) -> Iterator[QueryShape]:
+    # Imported late so mongodb_config.MONGO_DB_NAME can point at the scratch database first
+    from app.db.mongodb import _build_jobs_query, _job_id_candidates
+    from app.db.job_compaction import _expiry_rules
+    from app.db.job_archive import _archivable_filter
+
+    company_id, dispatcher_id, driver_id, child = sample["company_id"], sample["dispatcher_id"], sample["driver_id"], sample["child"]
+    pending, original = JobStatus.PENDING.value, JobType.ORIGINAL.value
+
+    # get_jobs_mongodb with the filter combinations the API and frontend send
+    job_lists = {
+        "company": dict(company_id=company_id),
+        "company+type+status": dict(company_id=company_id, job_type=JobType.APPLICATION.value, status=JobStatus.APPLICATION_REQUESTED.value),
+        "dispatcher": dict(created_by_dispatcher_id=dispatcher_id),
+        "dispatcher+type": dict(created_by_dispatcher_id=dispatcher_id, job_type=original),
+        "driver+type": dict(assigned_driver_id=driver_id, job_type=original),
+        "driver+type+status": dict(assigned_driver_id=driver_id, job_type=JobType.COPIED.value, status=JobStatus.PENDING_ACCEPTANCE.value),
+        "public_board": dict(is_public=True, status=pending),
+        "public_board+type": dict(is_public=True, status=pending, job_type=original),
+    }
+    for label, filters in job_lists.items():
+        yield QueryShape(f"get_jobs_mongodb[{label}]", "jobs_collection", _build_jobs_query(**filters))
+
+    child_types = {"$in": CHILD_TYPES}
+    yield QueryShape("get_jobs_by_ids_mongodb", "jobs_collection", {"_id": {"$in": _job_id_candidates(sample["job_ids"])}})
+    yield QueryShape("get_job_by_copied_job_id_mongodb", "jobs_collection", {"copied_job_id": child["copied_job_id"]})
+    yield QueryShape("accept_copied_job_mongodb[copy]", "jobs_collection", {"copied_job_id": child["copied_job_id"], "job_type": child_types})
+    yield QueryShape("accept_copied_job_mongodb[original]", "jobs_collection", {"_id": ObjectId(child["original_job_id"]), "job_type": original, "status": pending, "assigned_driver_id": None}, kind="findAndModify")
+    supersede = {"original_job_id": child["original_job_id"], "job_type": child_types, "_id": {"$nin": [child["_id"]]}, "status": {"$ne": JobStatus.SUPERSEDED.value}}
+    yield QueryShape("accept_copied_job_mongodb[sibling counts]", "jobs_collection", supersede, kind="aggregate")
+    yield QueryShape("accept_copied_job_mongodb[supersede]", "jobs_collection", supersede, kind="update")
+    yield QueryShape("reject_copied_job_mongodb", "jobs_collection", {"copied_job_id": child["copied_job_id"], "job_type": child_types, "status": {"$in": [JobStatus.PENDING_ACCEPTANCE.value, JobStatus.APPLICATION_REQUESTED.value]}}, kind="findAndModify")
+    yield QueryShape("delete_driver_application_mongodb", "jobs_collection", {"copied_job_id": child["copied_job_id"], "assigned_driver_id": child["assigned_driver_id"], "status": {"$in": [JobStatus.SUPERSEDED.value, JobStatus.REJECTED.value, JobStatus.ACCEPTED.value]}}, kind="findAndModify")
+    yield QueryShape("_children_status_counts", "jobs_collection", {"original_job_id": {"$in": [child["original_job_id"]]}, "job_type": child_types}, kind="aggregate")
+    yield QueryShape("delete_children_mongodb", "jobs_collection", {"original_job_id": {"$in": [child["original_job_id"]]}, "job_type": child_types}, kind="delete")
+    for rule, rule_filter in _expiry_rules(now).items():
+        yield QueryShape(f"compact_job_copies_mongodb[{rule}]", "jobs_collection", rule_filter)
+    yield QueryShape("archive_jobs_mongodb", "jobs_collection", _archivable_filter(now))
+
+    yield QueryShape("get_user_by_username_mongodb", "users_collection", {"username": sample["username"]})
+    yield QueryShape("get_dispatchers_by_company_id_mongodb", "users_collection", {"company_id": company_id, "roles": RoleType.DISPATCHER.value})
+    yield QueryShape("get_drivers_by_company_id_mongodb", "users_collection", {"company_id": company_id, "roles": RoleType.DRIVER.value, "driver_association_status": DriverAssociationStatus.ASSOCIATED.value})
+    yield QueryShape("get_users_by_role[role]", "users_collection", {"roles": RoleType.DISPATCHER.value})
+    yield QueryShape("get_invitations_for_invitee_mongodb", "invitations_collection", {"invitee_id": driver_id, "invitee_role": RoleType.DRIVER.value, "status": InvitationStatus.PENDING.value})
+    yield QueryShape("get_vehicles_mongodb[owner]", "vehicles_collection", {"owner_id": driver_id})
+    yield QueryShape("get_company_roster_mongodb[members]", "users_collection", {"$or": [{"company_id": company_id}, {"_id": ObjectId(company_id)}]})
+    yield QueryShape("get_company_roster_mongodb[pending_invitations]", "invitations_collection", {"company_id": company_id, "status": InvitationStatus.PENDING.value})
+
+def _walk(node: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+def summarize_plan(explain: Dict[str, Any]) -> Tuple[List[str], List[str], Optional[int]]:
+    """Stages and index names of the winning plan, and the documents examined, from any explain layout."""
+    stages, indexes, examined = [], [], None
+    for node in _walk(explain):
+        if "winningPlan" in node:
+            for plan_node in _walk(node["winningPlan"]):
+                if "stage" in plan_node:
+                    stages.append(plan_node["stage"])
+                if "indexName" in plan_node:
+                    indexes.append(plan_node["indexName"])
+        if isinstance(node.get("totalDocsExamined"), int):
+            examined = max(examined or 0, node["totalDocsExamined"])
+    return stages, indexes, examined
+
+async def check_shape(shape: QueryShape) -> Tuple[bool, str]:
+    database = mongodb_config.get_database()
+    explain = await database.command(shape.explain_command())
+    matched = await database[shape.collection].count_documents(shape.filter)
+    stages, indexes, examined = summarize_plan(explain)
+    problems = []
+    if "COLLSCAN" in stages:
+        problems.append("collection scan")
+    elif not INDEX_STAGES.intersection(stages):
+        problems.append(f"no index stage in {stages}")
+    if examined is not None and examined > EXAMINED_RATIO * matched + EXAMINED_SLACK:
+        problems.append(f"examined {examined} documents for {matched} matches")
+    detail = f"indexes={','.join(dict.fromkeys(indexes)) or '-'} examined={examined} matched={matched}"
+    return not problems, f"{detail}{' -- ' + '; '.join(problems) if problems else ''}"
+
+async def run(database_name: str, keep: bool) -> int:
+    if database_name == mongodb_config.MONGO_DB_NAME:
+        raise SystemExit(f"Refusing to seed and drop the application database {database_name!r}; pass --database.")
+    mongodb_config.MONGO_DB_NAME = database_name
+    mongodb_config.connect_mongodb()
+    from app.db.mongodb import ensure_indexes_mongodb
+
+    client = mongodb_config.client
+    await client.drop_database(database_name)
+    try:
+        now = datetime.now(timezone.utc)
+        documents, sample = _seed_documents(random.Random(42), now)
+        database = mongodb_config.get_database()
+        for collection_name, docs in documents.items():
+            await database[collection_name].insert_many(docs)
+        await ensure_indexes_mongodb()
+
+        failures = 0
+        for shape in query_shapes(sample, now):
+            ok, detail = await check_shape(shape)
+            failures += not ok
+            print(f"{'PASS' if ok else 'FAIL'}  {shape.name:<48} {detail}")
+        print(f"\n{failures} of the query shapes failed." if failures else "\nAll query shapes are served by an index.")
+        return 1 if failures else 0
+    finally:
+        if not keep:
+            await client.drop_database(database_name)
+        mongodb_config.close_mongodb()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", default=f"{mongodb_config.MONGO_DB_NAME}_query_plans", help="Scratch database to seed (dropped before and after the run)")
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded database for inspection")
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args.database, args.keep))
+
+if __name__ == "__main__":
+    sys.exit(main())
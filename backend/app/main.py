@@ -1,10 +1,94 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from pymongo.errors import AutoReconnect, ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError
+import asyncio
 import os
 
-from app.api.v1.endpoints import tasks, users, jobs, companies, dispatchers, drivers, vehicles
+from app.api.v1.endpoints import tasks, users, jobs, companies, dispatchers, drivers, vehicles, ops
+from app.db import mongodb, job_compaction, job_archive
+from app.core.periodic import run_periodically
+from app.core import mongodb_config
+from app.crud.identity_map import IdentityMapMiddleware
+from app.core.admission import AdmissionControlMiddleware, RouteLimit
+from app.core.spreadsheets import spreadsheet_pool, SpreadsheetPoolBusy, SpreadsheetTimeout
+from app.core.loop_monitor import loop_monitor, RequestMetricsMiddleware
+from app.core.request_profiler import RequestProfilerMiddleware
+from app.api.v1.schemas.users import RoleType
 
-app = FastAPI(title="Driver Manager System API")
+# Seconds between full rebuilds of the job status counters (0 disables)
+COUNTER_RECONCILE_INTERVAL_SECONDS = float(os.getenv("COUNTER_RECONCILE_INTERVAL_SECONDS", "3600"))
+background_tasks = []
+
+def start_background_tasks():
+    if COUNTER_RECONCILE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            run_periodically("reconcile_job_counters", COUNTER_RECONCILE_INTERVAL_SECONDS, mongodb.rebuild_job_counters_mongodb)
+        ))
+    if job_compaction.JOB_COMPACTION_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            run_periodically("compact_job_copies", job_compaction.JOB_COMPACTION_INTERVAL_SECONDS, job_compaction.compact_job_copies_mongodb)
+        ))
+    if job_archive.JOB_ARCHIVE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            run_periodically("archive_jobs", job_archive.JOB_ARCHIVE_INTERVAL_SECONDS, job_archive.archive_jobs_mongodb)
+        ))
+
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mongodb_config.connect_mongodb()
+    try:
+        await mongodb_config.ping_mongodb()
+        await mongodb.ensure_indexes_mongodb()
+    except Exception as e:
+        # Keep serving: /readyz reports the outage and requests fail fast until the cluster is back
+        print(f"MongoDB not reachable at startup: {e!r}")
+    start_background_tasks()
+    loop_monitor.start()
+    try:
+        yield
+    finally:
+        await loop_monitor.stop()
+        await stop_background_tasks()
+        spreadsheet_pool.shutdown()
+        mongodb_config.close_mongodb()
+
+app = FastAPI(title="Driver Manager System API", lifespan=lifespan)
+
+# Set to "false" to turn off rate limiting and concurrency caps (e.g. for load tests)
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Admission rules, first match wins. Rates are requests per second per worker process.
+ROUTE_LIMITS = [
+    # Job board and list polling
+    RouteLimit("GET", "/api/v1/jobs/", user_rate=2, user_burst=10, company_rate=20, company_burst=60),
+    # Expensive routes: few at a time, a short queue, then 429
+    RouteLimit("GET", "/api/v1/jobs/export", user_rate=0.2, user_burst=2, max_concurrent=2, max_queued=4, queue_timeout_seconds=10),
+    RouteLimit("POST", "/api/v1/dispatchers/jobs/upload", user_rate=0.2, user_burst=2, max_concurrent=2, max_queued=2, queue_timeout_seconds=10),
+    RouteLimit("GET", "/api/v1/companies/analytics", user_rate=1, user_burst=5, max_concurrent=4, max_queued=8),
+    # Everything else
+    RouteLimit("*", "/api/v1/", prefix=True, user_rate=10, user_burst=40, company_rate=100, company_burst=300),
+]
+
+async def company_of(username: str):
+    # Company whose shared rate limit a user's requests count against: "" when they have none, None for unknown users
+    user_data = await mongodb.get_user_by_username_mongodb(username)
+    if not user_data:
+        return None
+    if RoleType.COMPANY.value in user_data.get("roles", []):
+        return user_data["id"]
+    return user_data.get("company_id") or ""
+
+# Admission control sits inside CORS (added later, so it wraps this) so 429 responses carry CORS headers
+if ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware, limits=ROUTE_LIMITS, company_of=company_of)
 
 # CORS Middleware
 # Allow origins from environment variable (for Render deployment)
@@ -27,6 +111,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request-scoped identity map: each entity is fetched at most once per request
+app.add_middleware(IdentityMapMiddleware)
+
+# On-demand profiling of single requests by operators (see app/api/v1/endpoints/ops.py)
+app.add_middleware(RequestProfilerMiddleware, is_operator=ops.is_operator)
+
+# Outermost, so request timings include admission control and CORS
+app.add_middleware(RequestMetricsMiddleware)
+
 # Include API routers
 app.include_router(tasks.router, prefix="/api/v1", tags=["tasks"])
 app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["jobs"])
@@ -35,7 +128,40 @@ app.include_router(companies.router, prefix="/api/v1/companies", tags=["companie
 app.include_router(dispatchers.router, prefix="/api/v1/dispatchers", tags=["dispatchers"])
 app.include_router(drivers.router, prefix="/api/v1/drivers", tags=["drivers"])
 app.include_router(vehicles.router, prefix="/api/v1/vehicles", tags=["vehicles"])
+app.include_router(ops.router, prefix="/api/v1/ops", tags=["ops"])
+
+# Database outages and slow queries surface as 503/504 instead of a generic 500
+@app.exception_handler(ServerSelectionTimeoutError)
+@app.exception_handler(AutoReconnect)
+@app.exception_handler(NetworkTimeout)
+async def database_unavailable_handler(request: Request, exc: Exception):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": "Database is unavailable, try again shortly."}, headers={"Retry-After": "5"})
+
+@app.exception_handler(ExecutionTimeout)
+async def database_timeout_handler(request: Request, exc: ExecutionTimeout):
+    return JSONResponse(status_code=status.HTTP_504_GATEWAY_TIMEOUT, content={"detail": "The query took too long, narrow the filters and try again."})
+
+@app.exception_handler(SpreadsheetPoolBusy)
+async def spreadsheet_pool_busy_handler(request: Request, exc: SpreadsheetPoolBusy):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": "Too many spreadsheets are being processed, try again shortly."}, headers={"Retry-After": "10"})
+
+@app.exception_handler(SpreadsheetTimeout)
+async def spreadsheet_timeout_handler(request: Request, exc: SpreadsheetTimeout):
+    return JSONResponse(status_code=status.HTTP_504_GATEWAY_TIMEOUT, content={"detail": "The spreadsheet took too long to process, try a smaller file."})
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to the Driver Manager System API"}
\ No newline at end of file
+    return {"message": "Welcome to the Driver Manager System API"}
+
+@app.get("/healthz", include_in_schema=False)
+def liveness():
+    # The process is up; deliberately does not touch the database
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    try:
+        await mongodb_config.ping_mongodb()
+    except Exception as e:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unavailable", "detail": repr(e)})
+    return {"status": "ok"}
\ No newline at end of file